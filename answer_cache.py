@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import sql_generation
+
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 512))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get("ANSWER_CACHE_MAX_BYTES", 32 * 1024 * 1024))  # noqa: E501
+
+
+def normalize_question(question):
+    """Case, whitespace and final punctuation do not change a question; also
+    used to recognize golden records asking the same."""
+    return " ".join((question or "").lower().split()).rstrip("?!. ")
+
+
+class AnswerCache:
+    """LRU cache of complete streamed answers, bounded by entry count, total
+    size and age."""
+
+    def __init__(self, ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(host, db_connection_id, question):
+        return host, db_connection_id, normalize_question(question)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            chunks, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return chunks
+
+    def put(self, key, chunks):
+        chunks = tuple(chunks)
+        size = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (chunks, size, time.monotonic() + self.ttl)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:  # noqa: E501
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, host, db_connection_id=None):
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key[0] == host and db_connection_id in (None, key[1])]:
+                self._pop(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+_cache = AnswerCache(ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_MAX_BYTES)  # noqa: E501
+
+
+def stream_sql_generation(host, db_connection_id, question, stats=None, on_response=None):  # noqa: E501
+    """Like sql_generation.stream_sql_generation, but replays a cached answer
+    when the same question was fully answered before for this connection."""
+    stats = stats if stats is not None else sql_generation.StreamStats()
+    key = AnswerCache.key(host, db_connection_id, question)
+    chunks = _cache.get(key)
+    if chunks is not None:
+        stats.cached = True
+        stats.started_at = stats.first_token_at = time.monotonic()
+        for chunk in chunks:
+            stats.tokens += len(chunk.split())
+            stats.bytes += len(chunk.encode("utf-8"))
+            yield chunk
+        stats.finished_at = time.monotonic()
+        return
+    chunks = []
+    for chunk in sql_generation.stream_sql_generation(host, db_connection_id, question, stats, on_response):  # noqa: E501
+        chunks.append(chunk)
+        yield chunk
+    # Only answers that streamed to the end are cached; an abandoned or failed
+    # stream never gets here.
+    _cache.put(key, chunks)
+
+
+def invalidate(host, db_connection_id=None):
+    """Drops cached answers, e.g. after golden records or instructions change."""
+    _cache.invalidate(host, db_connection_id)
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import uuid
+
+import requests
+
+import answer_cache
+import query_results
+import sql_generation
+
+# How long a finished answer stays available to a reloaded page.
+ANSWER_JOB_RETENTION = float(os.environ.get("ANSWER_JOB_RETENTION", 600))
+# Seconds a new question waits for the answer it stopped to finish.
+ANSWER_JOB_CANCEL_TIMEOUT = float(os.environ.get("ANSWER_JOB_CANCEL_TIMEOUT", 2))
+
+
+class JobState:
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+
+class AnswerJob:
+    """Generates one answer in a background thread, independent of the script
+    run that started it.
+
+    The streamed text is kept in a buffer that any number of readers can tail,
+    so a rerun or a reloaded page picks the answer up where it is. Result
+    tables are taken out of the text and collected in `results`.
+    """
+
+    def __init__(self, host, db_connection_id, question):
+        self.id = uuid.uuid4().hex
+        self.host = host
+        self.db_connection_id = db_connection_id
+        self.question = question
+        self.state = JobState.RUNNING
+        self.error = None
+        self.stats = sql_generation.StreamStats()
+        self.results = []
+        self.finished_at = None
+        self._chunks = []
+        self._changed = threading.Condition()
+        self._cancelled = threading.Event()
+        self._response = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"answer-{self.id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self.state == JobState.RUNNING
+
+    @property
+    def text(self):
+        with self._changed:
+            return "".join(self._chunks)
+
+    def cancel(self):
+        """Stops the generation and closes the engine connection, so the engine
+        sees the client go away instead of streaming to nobody."""
+        self._cancelled.set()
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def wait(self, timeout=None):
+        """Waits for the job to finish; returns whether it has."""
+        self._thread.join(timeout)
+        return not self.running
+
+    def tail(self, poll_interval=0.5):
+        """Yields the answer from the start, then new text as it arrives, until
+        the job finishes. Quiet polls yield an empty string, which gives
+        Streamlit a chance to stop a script run that is waiting here."""
+        position = 0
+        while True:
+            with self._changed:
+                if position == len(self._chunks) and self.running:
+                    self._changed.wait(poll_interval)
+                chunks = self._chunks[position:]
+                position += len(chunks)
+                finished = not self.running and position == len(self._chunks)
+            if chunks or not finished:
+                yield "".join(chunks)
+            if finished:
+                return
+
+    def _on_response(self, response):
+        self._response = response
+        if self._cancelled.is_set():
+            response.close()
+
+    def _run(self):
+        state = JobState.FAILED
+        try:
+            for chunk in query_results.extract(
+                    answer_cache.stream_sql_generation(
+                        self.host, self.db_connection_id, self.question, self.stats,  # noqa: E501
+                        self._on_response),
+                    self.results):
+                if self._cancelled.is_set():
+                    break
+                with self._changed:
+                    self._chunks.append(chunk)
+                    self._changed.notify_all()
+            state = JobState.DONE
+        except requests.exceptions.RequestException as e:
+            if not self._cancelled.is_set():
+                self.error = f"Connection failed due to {e}."
+        except Exception as e:
+            # Reading from a response closed by cancel() raises e.g.
+            # AttributeError or ValueError; only then is the error expected.
+            if not self._cancelled.is_set():
+                self.error = f"Could not generate the answer: {e!r}."
+                # Reraised so the traceback reaches the server log.
+                raise
+        finally:
+            if self._cancelled.is_set():
+                state = JobState.CANCELLED
+            with self._changed:
+                self.state = state
+                self.finished_at = time.monotonic()
+                self._changed.notify_all()
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _expire():
+    now = time.monotonic()
+    for job_id in [job_id for job_id, job in _jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > ANSWER_JOB_RETENTION]:  # noqa: E501
+        del _jobs[job_id]
+
+
+def start(host, db_connection_id, question):
+    job = AnswerJob(host, db_connection_id, question)
+    with _jobs_lock:
+        _expire()
+        _jobs[job.id] = job
+    return job.start()
+
+
+def get(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
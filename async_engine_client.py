@@ -0,0 +1,69 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import disk_cache
+import engine_client
+
+# One event loop per server process, shared by every Streamlit session thread.
+# Identical GETs that are in flight at the same time are sent to the engine
+# once and every caller receives the same response.
+_loop = None
+_loop_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=engine_client.POOL_SIZE, thread_name_prefix="engine-client")
+_in_flight = {}
+
+# Registered here because engine_client cannot import disk_cache when it loads.
+disk_cache.on_change("/api/v1/database-connections", engine_client.connections_changed)  # noqa: E501
+
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="engine-client-loop", daemon=True).start()  # noqa: E501
+                _loop = loop
+    return _loop
+
+
+def _request_key(host, path, params):
+    return host, path, json.dumps(params, sort_keys=True, default=str)
+
+
+def _load(host, path, kwargs):
+    cacheable = disk_cache.cacheable(path)
+    if cacheable:
+        body = disk_cache.lookup(host, path, kwargs.get("params"))
+        if body is not None:
+            return disk_cache.as_response(body, host, path)
+    response = engine_client.get(host, path, **kwargs)
+    # Read the body here so the shared response never touches the socket again.
+    response.content
+    if cacheable:
+        disk_cache.store_response(host, path, kwargs.get("params"), response)
+    return response
+
+
+async def get(host, path, params=None, **kwargs):
+    """Coalesced GET: awaits the in-flight request for the same resource if
+    there is one, otherwise starts it."""
+    key = _request_key(host, path, params)
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(
+            _executor, _load, host, path, dict(kwargs, params=params))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded so one cancelled waiter does not cancel the shared request.
+    return await asyncio.shield(future)
+
+
+def coalesced_get(host, path, params=None, **kwargs):
+    """Blocking wrapper around get() for use from Streamlit script threads."""
+    return asyncio.run_coroutine_threadsafe(
+        get(host, path, params=params, **kwargs), _get_loop()).result()
@@ -0,0 +1,161 @@
+"""Runs a set of questions against the engine concurrently.
+
+Usage:
+    python batch_runner.py questions.jsonl --host http://localhost \\
+        --db-connection-id <id> --concurrency 4 --output results.csv
+
+Each line of the JSONL file holds a question in "prompt_text" (or "question")
+and optionally the expected SQL in "sql", the same shape as the golden record
+upload.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import requests
+
+import sql_generation
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_RUNNER_CONCURRENCY", 4))
+
+@dataclass
+class QuestionResult:
+    line_number: int
+    question: str
+    expected_sql: Optional[str] = None
+    generated_sql: Optional[str] = None
+    sql_matches: Optional[bool] = None
+    latency: Optional[float] = None
+    time_to_first_token: Optional[float] = None
+    error: Optional[str] = None
+    answer: str = ""
+
+
+def load_questions(lines):
+    """Returns (line_number, question, expected_sql) tuples from JSONL lines and
+    the line numbers that could not be read."""
+    questions = []
+    rejected = []
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue
+        try:
+            line_data = json.loads(line)
+            question = line_data.get("prompt_text") or line_data.get("question")
+        except (json.JSONDecodeError, AttributeError):
+            question = None
+        if not question:
+            rejected.append(line_number)
+            continue
+        questions.append((line_number, question, line_data.get("sql")))
+    return questions, rejected
+
+
+def _normalize_sql(sql):
+    return " ".join(sql.lower().rstrip().rstrip(";").split())
+
+
+def run_question(host, db_connection_id, line_number, question, expected_sql=None):  # noqa: E501
+    result = QuestionResult(line_number, question, expected_sql)
+    stats = sql_generation.StreamStats()
+    try:
+        result.answer = "".join(
+            sql_generation.stream_sql_generation(host, db_connection_id, question, stats))  # noqa: E501
+    except requests.exceptions.RequestException as e:
+        result.error = str(e)
+    result.latency = stats.finished_at - stats.started_at
+    result.time_to_first_token = stats.time_to_first_token
+    result.generated_sql = sql_generation.extract_sql(result.answer)
+    if expected_sql and result.generated_sql:
+        result.sql_matches = _normalize_sql(expected_sql) == _normalize_sql(result.generated_sql)  # noqa: E501
+    return result
+
+
+def run_batch(host, db_connection_id, questions, concurrency=BATCH_CONCURRENCY,
+              on_result=None):
+    """Answers `questions` with at most `concurrency` generations in flight.
+
+    `on_result(result, completed)` is called from the calling thread as each
+    question finishes; results are returned in input order.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-runner") as executor:  # noqa: E501
+        futures = [
+            executor.submit(run_question, host, db_connection_id, *question)
+            for question in questions]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            if on_result is not None:
+                on_result(result, completed)
+    results.sort(key=lambda result: result.line_number)
+    return results
+
+
+def summarize(results, elapsed):
+    latencies = sorted(result.latency for result in results if result.error is None)
+    checked = [result.sql_matches for result in results if result.sql_matches is not None]  # noqa: E501
+
+    def percentile(fraction):
+        if not latencies:
+            return None
+        return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)]
+
+    return {
+        "questions": len(results),
+        "errors": sum(result.error is not None for result in results),
+        "questions_per_second": len(results) / elapsed if elapsed else None,
+        "latency_p50": percentile(0.5),
+        "latency_p95": percentile(0.95),
+        "sql_match_rate": sum(checked) / len(checked) if checked else None,
+    }
+
+
+def write_csv(results, file):
+    writer = csv.DictWriter(file, fieldnames=list(QuestionResult.__dataclass_fields__))
+    writer.writeheader()
+    for result in results:
+        writer.writerow(asdict(result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of questions against the Dataherald engine.")  # noqa: E501
+    parser.add_argument("questions", help="JSONL file with prompt_text (and optionally sql) keys")  # noqa: E501
+    parser.add_argument("--host", required=True, help="Engine URI")
+    parser.add_argument("--db-connection-id", required=True)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--output", help="CSV file for the results (default: stdout)")  # noqa: E501
+    args = parser.parse_args(argv)
+
+    with open(args.questions, encoding="utf-8") as file:
+        questions, rejected = load_questions(file)
+    for line_number in rejected:
+        print(f"Skipping line {line_number}: no question found.", file=sys.stderr)
+
+    def on_result(result, completed):
+        status = "error" if result.error else f"{result.latency:.2f}s"
+        print(f"[{completed}/{len(questions)}] line {result.line_number}: {status}", file=sys.stderr)  # noqa: E501
+
+    start = time.monotonic()
+    results = run_batch(args.host, args.db_connection_id, questions, args.concurrency, on_result)  # noqa: E501
+    summary = summarize(results, time.monotonic() - start)
+
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as file:
+            write_csv(results, file)
+    else:
+        write_csv(results, sys.stdout)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
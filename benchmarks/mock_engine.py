@@ -0,0 +1,289 @@
+"""A local stand-in for the Dataherald engine, for benchmarks and offline work.
+
+Usage:
+    python -m benchmarks.mock_engine --port 8000 --golden-records 10000
+
+It serves the endpoints the pages use with generated data. Records are built
+from their position on demand, so 100k golden records cost no memory until a
+page of them is requested.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DB_CONNECTION_ALIAS = "RealEstate"
+DB_CONNECTION_ID = "65a1c0ffee0000000000000a"
+
+
+@dataclass
+class MockEngineConfig:
+    golden_records: int = 100
+    instructions: int = 20
+    tables: int = 50
+    columns_per_table: int = 10
+    # Seconds added before every response.
+    latency: float = 0.0
+    # Extra characters added to every question, SQL query and instruction.
+    payload_size: int = 0
+    stream_chunks: int = 20
+    stream_chunk_delay: float = 0.01
+    # Rows of the Markdown result table in every answer.
+    result_rows: int = 5
+
+
+def _padding(config):
+    return " --" + "x" * config.payload_size if config.payload_size else ""
+
+
+def golden_record(config, position):
+    return {
+        "id": f"{position:024x}",
+        "db_connection_id": DB_CONNECTION_ID,
+        "question": f"What was the median sale price in city {position}?{_padding(config)}",  # noqa: E501
+        "sql_query": f"SELECT median_sale_price FROM redfin_sales WHERE city_id = {position}{_padding(config)}",  # noqa: E501
+        "created_at": "2024-01-01T00:00:00",
+        "metadata": {},
+    }
+
+
+def instruction(config, position):
+    return {
+        "id": f"{position:024x}",
+        "db_connection_id": DB_CONNECTION_ID,
+        "instruction": f"Always filter rows of region {position} by state.{_padding(config)}",  # noqa: E501
+        "metadata": {},
+    }
+
+
+def table_description(config, position, status="SCANNED"):
+    return {
+        "id": f"{position:024x}",
+        "db_connection_id": DB_CONNECTION_ID,
+        "table_name": f"table_{position}",
+        "description": f"Generated table {position}.",
+        "columns": [
+            {"name": f"column_{column}", "data_type": "VARCHAR", "description": None}
+            for column in range(config.columns_per_table)],
+        "status": status,
+    }
+
+
+class MockEngine:
+    """Generated engine state plus per-endpoint request counts."""
+
+    def __init__(self, config=None):
+        self.config = config or MockEngineConfig()
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._added_golden_records = []
+        self._added_instructions = []
+        self._deleted = set()
+        self._scanned = set()
+
+    def count(self, method, path):
+        with self._lock:
+            self.requests[(method, path)] += 1
+
+    def total_requests(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def _page(self, total, added, build, params):
+        page = int(params.get("page", 1))
+        limit = int(params.get("limit", 10))
+        start = (page - 1) * limit
+        positions = range(total)
+        if self._deleted:
+            # Ids follow from positions, so deleted records are skipped without
+            # building the records before the requested page.
+            positions = (position for position in positions
+                         if f"{position:024x}" not in self._deleted)
+        else:
+            skipped = min(start, total)
+            positions, start = positions[skipped:], start - skipped
+        items = itertools.chain(
+            positions, (record for record in added if record["id"] not in self._deleted))  # noqa: E501
+        return [item if isinstance(item, dict) else build(self.config, item)
+                for item in itertools.islice(items, start, start + limit)]
+
+    def golden_records(self, params):
+        return self._page(self.config.golden_records, self._added_golden_records, golden_record, params)  # noqa: E501
+
+    def instructions(self, params):
+        return self._page(self.config.instructions, self._added_instructions, instruction, params)  # noqa: E501
+
+    def table_descriptions(self):
+        return [table_description(self.config, position, self._status(position))
+                for position in range(self.config.tables)]
+
+    def _status(self, position):
+        return "SCANNED" if position % 2 == 0 or position in self._scanned else "NOT_SCANNED"  # noqa: E501
+
+    def add_golden_records(self, records):
+        with self._lock:
+            created = []
+            for record in records:
+                position = self.config.golden_records + len(self._added_golden_records)
+                created.append(dict(
+                    golden_record(self.config, position),
+                    question=record["prompt_text"], sql_query=record["sql"]))
+                self._added_golden_records.append(created[-1])
+            return created
+
+    def add_instruction(self, body):
+        with self._lock:
+            position = self.config.instructions + len(self._added_instructions)
+            created = dict(instruction(self.config, position), instruction=body["instruction"])  # noqa: E501
+            self._added_instructions.append(created)
+            return created
+
+    def delete(self, record_id):
+        with self._lock:
+            self._deleted.add(record_id)
+
+    def scan(self, table_names):
+        with self._lock:
+            self._scanned.update(
+                int(table_name.rsplit("_", 1)[1]) for table_name in table_names)
+
+    def answer_chunks(self, question):
+        yield f"Looking into: {question}\n".encode()
+        for chunk in range(self.config.stream_chunks):
+            yield f"Step {chunk}: checked the sales tables.{_padding(self.config)}\n".encode()  # noqa: E501
+        yield b"```sql\nSELECT city_id, median_sale_price, period_end FROM redfin_sales\n```\n"  # noqa: E501
+        yield b"| city_id | median_sale_price | period_end |\n| --- | ---: | --- |\n"
+        rows = (f"| {row} | {412000 + row}.5 | 2023-06-30 |\n".encode()
+                for row in range(self.config.result_rows))
+        while True:
+            # Many rows per chunk, as a fast engine would send them.
+            chunk = b"".join(itertools.islice(rows, 1000))
+            if not chunk:
+                break
+            yield chunk
+        yield b"The median sale price is 412000.\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    engine = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _begin(self):
+        url = urlparse(self.path)
+        self.engine.count(self.command, url.path)
+        if self.engine.config.latency:
+            time.sleep(self.engine.config.latency)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        return url.path, params
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+                time.sleep(self.engine.config.stream_chunk_delay)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The app stopped the generation.
+            self.close_connection = True
+
+    def do_GET(self):
+        path, params = self._begin()
+        if path == "/api/v1/heartbeat":
+            self._send(200, {"status": "ok"})
+        elif path == "/api/v1/database-connections":
+            self._send(200, [{"id": DB_CONNECTION_ID, "alias": DB_CONNECTION_ALIAS}])
+        elif path == "/api/v1/golden-sqls":
+            self._send(200, self.engine.golden_records(params))
+        elif path == "/api/v1/instructions":
+            self._send(200, self.engine.instructions(params))
+        elif path == "/api/v1/table-descriptions":
+            self._send(200, self.engine.table_descriptions())
+        elif path.startswith("/api/v1/table-descriptions/"):
+            position = int(path.rsplit("/", 1)[1], 16)
+            if position < self.engine.config.tables:
+                self._send(200, table_description(self.engine.config, position, self.engine._status(position)))  # noqa: E501
+            else:
+                self._send(404, {"detail": "Table description not found"})
+        else:
+            self._send(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        path, _ = self._begin()
+        body = self._body()
+        if path == "/api/v1/stream-sql-generation":
+            self._stream(self.engine.answer_chunks(body["prompt"]["text"]))
+        elif path == "/api/v1/golden-sqls":
+            self._send(201, self.engine.add_golden_records(body))
+        elif path == "/api/v1/instructions":
+            self._send(201, self.engine.add_instruction(body))
+        elif path == "/api/v1/table-descriptions/sync-schemas":
+            self.engine.scan(body["table_names"])
+            self._send(201, [])
+        elif path == "/api/v1/database-connections":
+            self._send(200, dict(body, id=DB_CONNECTION_ID))
+        else:
+            self._send(404, {"detail": "Not Found"})
+
+    def do_PUT(self):
+        path, _ = self._begin()
+        self._send(200, dict(self._body(), id=path.rsplit("/", 1)[1]))
+
+    def do_DELETE(self):
+        path, _ = self._begin()
+        self.engine.delete(path.rsplit("/", 1)[1])
+        self._send(200, {"status": True})
+
+
+def start(config=None, port=0):
+    """Serves a MockEngine from a background thread and returns (engine, server);
+    the engine URI is http://127.0.0.1:<server.server_port>."""
+    engine = MockEngine(config)
+    handler = type("Handler", (_Handler,), {"engine": engine})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-engine", daemon=True).start()  # noqa: E501
+    return engine, server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock Dataherald engine.")
+    parser.add_argument("--port", type=int, default=8000)
+    for name, default in vars(MockEngineConfig()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)  # noqa: E501
+    args = parser.parse_args(argv)
+    config = MockEngineConfig(**{name: getattr(args, name) for name in vars(MockEngineConfig())})  # noqa: E501
+    _, server = start(config, args.port)
+    print(f"Mock engine listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Drives the app pages against the mock engine and reports what each rerun costs.
+
+Usage:
+    python -m benchmarks.run_benchmarks --golden-records 100 10000 100000 \\
+        --repeat 3 --output results.json
+
+Run it from the repository root. Every step is a Streamlit rerun executed with
+AppTest. For each one the report shows the median wall time, the engine
+requests it made and the peak Python memory it allocated, as traced by
+tracemalloc. Work a page starts in the background, such as prefetching or
+building the search index, is counted only while the rerun is still running.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from streamlit.testing.v1 import AppTest
+
+import session_context
+from benchmarks import mock_engine
+
+RECORD_COUNTS = (100, 10_000, 100_000)
+RUN_TIMEOUT = 120
+
+HOME = "🏠_Home.py"
+DATABASE_INFO = "pages/1_🗃️_Database_Info.py"
+GOLDEN_RECORDS = "pages/2_🧈_Golden_Record_Management.py"
+INSTRUCTIONS = "pages/3_📜_Instructions.py"
+
+
+@dataclass
+class StepResult:
+    golden_records: int
+    page: str
+    step: str
+    seconds: float
+    requests: int
+    peak_memory_mb: float
+    error: str = None
+
+
+def _button(at, label):
+    return next(button for button in at.button if button.label == label)
+
+
+_questions = itertools.count()
+_asked = []
+
+
+def _ask_question(at):
+    # A new question every time, so each repeat goes to the engine.
+    _asked.append(f"What was the median sale price in city {next(_questions)}?")
+    at.chat_input[0].set_value(_asked[-1])
+
+
+def _ask_cached_question(at):
+    # The last question of the previous step, answered by the current engine.
+    at.chat_input[0].set_value(_asked[-1])
+
+
+def _show_tables(at):
+    _button(at, "Show tables").click()
+
+
+def _view_golden_records(at):
+    _button(at, "View").click()
+
+
+def _search_golden_records(at):
+    next(text_input for text_input in at.text_input
+         if text_input.label.startswith("Search")).set_value("city 42")
+    _button(at, "View").click()
+
+
+def _view_instructions(at):
+    _button(at, "View").click()
+
+
+# (page, step name, action applied before each rerun). The first step of each
+# page is its initial render.
+SCENARIOS = [
+    (HOME, "first render", None),
+    (HOME, "ask question", _ask_question),
+    (HOME, "ask again (cached)", _ask_cached_question),
+    (DATABASE_INFO, "first render", None),
+    (DATABASE_INFO, "show tables", _show_tables),
+    (GOLDEN_RECORDS, "first render", None),
+    (GOLDEN_RECORDS, "view page 1", _view_golden_records),
+    (GOLDEN_RECORDS, "search", _search_golden_records),
+    (INSTRUCTIONS, "first render", None),
+    (INSTRUCTIONS, "view", _view_instructions),
+]
+
+
+def _measure(engine, at, record_count, page, step, action, repeat):
+    seconds = []
+    requests = []
+    peak = 0
+    error = None
+    for _ in range(repeat):
+        if action is not None:
+            action(at)
+        before = engine.total_requests()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        at.run(timeout=RUN_TIMEOUT)
+        seconds.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        requests.append(engine.total_requests() - before)
+        if at.exception:
+            error = at.exception[0].value
+    return StepResult(
+        golden_records=record_count,
+        page=page,
+        step=step,
+        seconds=statistics.median(seconds),
+        requests=max(requests),
+        peak_memory_mb=peak / 2**20,
+        error=error)
+
+
+def run_benchmark(config, repeat=3):
+    """Runs every scenario against a fresh mock engine with `config`. Each engine
+    gets its own port, so nothing cached for an earlier run is reused."""
+    engine, server = mock_engine.start(config)
+    host = f"http://127.0.0.1:{server.server_port}"
+    # The Home page fills its engine URI input from ENGINE_URI.
+    os.environ["ENGINE_URI"] = host
+    results = []
+    apps = {}
+    try:
+        for page, step, action in SCENARIOS:
+            at = apps.get(page)
+            if at is None:
+                at = apps[page] = AppTest.from_file(page, default_timeout=RUN_TIMEOUT)
+                at.session_state["context"] = session_context.SessionContext(
+                    host, mock_engine.DB_CONNECTION_ID)
+            results.append(_measure(engine, at, config.golden_records, page, step, action, repeat))  # noqa: E501
+    finally:
+        server.shutdown()
+    return results
+
+
+def print_report(results, file=sys.stdout):
+    print(f"{'records':>8}  {'page':<40} {'step':<22} {'seconds':>8} {'requests':>8} {'peak MB':>8}", file=file)  # noqa: E501
+    for result in results:
+        print(f"{result.golden_records:>8}  {result.page:<40} {result.step:<22} "
+              f"{result.seconds:>8.3f} {result.requests:>8} {result.peak_memory_mb:>8.1f}"  # noqa: E501
+              + (f"  error: {result.error}" if result.error else ""), file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app pages against a mock engine.")  # noqa: E501
+    parser.add_argument("--golden-records", type=int, nargs="+", default=list(RECORD_COUNTS))  # noqa: E501
+    parser.add_argument("--instructions", type=int, default=mock_engine.MockEngineConfig.instructions)  # noqa: E501
+    parser.add_argument("--tables", type=int, default=mock_engine.MockEngineConfig.tables)  # noqa: E501
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every engine response")  # noqa: E501
+    parser.add_argument("--payload-size", type=int, default=0, help="Characters added to every record")  # noqa: E501
+    parser.add_argument("--repeat", type=int, default=3, help="Reruns per step; the median is reported")  # noqa: E501
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    tracemalloc.start()
+    results = []
+    for record_count in args.golden_records:
+        config = mock_engine.MockEngineConfig(
+            golden_records=record_count,
+            instructions=args.instructions,
+            tables=args.tables,
+            latency=args.latency,
+            payload_size=args.payload_size)
+        print(f"Benchmarking with {record_count} golden records...", file=sys.stderr)
+        results.extend(run_benchmark(config, args.repeat))
+    tracemalloc.stop()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump([asdict(result) for result in results], file, indent=2)
+    return 1 if any(result.error for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
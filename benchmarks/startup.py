@@ -0,0 +1,130 @@
+"""Measures cold starts: each repeat renders one page in a fresh Python
+process.
+
+Usage:
+    python -m benchmarks.startup --repeat 5 --latency 0.2 --output startup.json
+
+Run it from the repository root. For every page the report shows the median
+time to import Streamlit, the first render of the page (its imports, the
+engine requests it waits for and building the elements) and the whole process
+including interpreter start. A mock engine with the given latency stands in
+for the engine; pass --no-prewarm to compare against a start without the
+background prewarming of the Home page.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from benchmarks import mock_engine
+
+# Copied from run_benchmarks, which imports Streamlit: the child process must
+# start without it to measure the imports.
+HOME = "🏠_Home.py"
+PAGES = (HOME, "pages/1_🗃️_Database_Info.py", "pages/2_🧈_Golden_Record_Management.py", "pages/3_📜_Instructions.py")  # noqa: E501
+RUN_TIMEOUT = 120
+
+
+@dataclass
+class StartupResult:
+    page: str
+    import_seconds: float
+    first_render_seconds: float
+    process_seconds: float
+    heavy_modules_loaded: bool
+    error: str = None
+
+
+def _render_once(page, host):
+    """Runs in the child process: renders `page` once and prints the
+    timings."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    import session_context
+    imported = time.perf_counter()
+    at = AppTest.from_file(page, default_timeout=RUN_TIMEOUT)
+    if page != HOME:
+        # Other pages take the host from the session, as set by the Home page.
+        at.session_state["context"] = session_context.SessionContext(
+            host, mock_engine.DB_CONNECTION_ID)
+    at.run()
+    rendered = time.perf_counter()
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "first_render_seconds": rendered - imported,
+        "heavy_modules_loaded": "pandas" in sys.modules,
+        "error": at.exception[0].value if at.exception else None,
+    }))
+
+
+def measure(page, host, prewarm=True):
+    environment = dict(os.environ, ENGINE_URI=host, ENGINE_PREWARM="1" if prewarm else "0")  # noqa: E501
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--render", page, "--host", host],  # noqa: E501
+        env=environment, capture_output=True, text=True, timeout=RUN_TIMEOUT)
+    process_seconds = time.perf_counter() - start
+    if completed.returncode:
+        return StartupResult(page, 0.0, 0.0, process_seconds, False, completed.stderr.strip()[-500:])  # noqa: E501
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    return StartupResult(page=page, process_seconds=process_seconds, **timings)
+
+
+def run_benchmark(config, repeat=5, prewarm=True):
+    engine, server = mock_engine.start(config)
+    host = f"http://127.0.0.1:{server.server_port}"
+    results = []
+    try:
+        for page in PAGES:
+            runs = [measure(page, host, prewarm) for _ in range(repeat)]
+            errors = [run.error for run in runs if run.error]
+            results.append(StartupResult(
+                page=page,
+                import_seconds=statistics.median(run.import_seconds for run in runs),  # noqa: E501
+                first_render_seconds=statistics.median(run.first_render_seconds for run in runs),  # noqa: E501
+                process_seconds=statistics.median(run.process_seconds for run in runs),  # noqa: E501
+                heavy_modules_loaded=any(run.heavy_modules_loaded for run in runs),  # noqa: E501
+                error=errors[0] if errors else None))
+    finally:
+        server.shutdown()
+    return results
+
+
+def print_report(results, file=sys.stdout):
+    print(f"{'page':<40} {'import s':>9} {'render s':>9} {'process s':>10} {'pandas':>7}", file=file)  # noqa: E501
+    for result in results:
+        print(f"{result.page:<40} {result.import_seconds:>9.3f} {result.first_render_seconds:>9.3f} "  # noqa: E501
+              f"{result.process_seconds:>10.3f} {'yes' if result.heavy_modules_loaded else 'no':>7}"  # noqa: E501
+              + (f"  error: {result.error}" if result.error else ""), file=file)  # noqa: E501
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold starts of the app pages.")  # noqa: E501
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every engine response")  # noqa: E501
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per page; the median is reported")  # noqa: E501
+    parser.add_argument("--no-prewarm", action="store_true", help="Start without background prewarming")  # noqa: E501
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--render", help=argparse.SUPPRESS)
+    parser.add_argument("--host", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.render:
+        _render_once(args.render, args.host)
+        return 0
+
+    config = mock_engine.MockEngineConfig(latency=args.latency)
+    results = run_benchmark(config, args.repeat, prewarm=not args.no_prewarm)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump([asdict(result) for result in results], file, indent=2)
+    return 1 if any(result.error for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import itertools
+import os
+import time
+from collections import deque
+
+import streamlit as st
+
+import answer_jobs
+import sql_generation
+
+CHAT_HISTORY_MAX_TURNS = int(os.environ.get("CHAT_HISTORY_MAX_TURNS", 100))
+CHAT_HISTORY_MAX_BYTES = int(os.environ.get("CHAT_HISTORY_MAX_BYTES", 2 * 1024 * 1024))  # noqa: E501
+# Number of turns rendered at first, and added by each "Show earlier" click.
+CHAT_HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", 10))
+
+
+class Turn:
+    """One finished question and answer. Slotted, since a long session keeps
+    many of them in memory."""
+
+    __slots__ = (
+        "job_id", "question", "answer", "sql", "state", "error", "asked_at",
+        "time_to_first_token", "tokens_per_second", "cached", "results", "size")
+
+    def __init__(self, job_id, question, answer, state, error=None, asked_at=None,
+                 time_to_first_token=None, tokens_per_second=None, cached=False,
+                 results=()):
+        self.job_id = job_id
+        self.question = question
+        self.answer = answer
+        self.sql = sql_generation.extract_sql(answer)
+        self.state = state
+        self.error = error
+        self.asked_at = asked_at if asked_at is not None else time.time()
+        self.time_to_first_token = time_to_first_token
+        self.tokens_per_second = tokens_per_second
+        self.cached = cached
+        self.results = tuple(result.finish() for result in results)
+        self.size = (len(question.encode("utf-8")) + len(answer.encode("utf-8"))
+                     + len((error or "").encode("utf-8"))
+                     + sum(result.nbytes for result in self.results))
+
+    @classmethod
+    def from_job(cls, job):
+        return cls(
+            job.id, job.question, job.text, job.state, job.error,
+            time_to_first_token=job.stats.time_to_first_token,
+            tokens_per_second=job.stats.tokens_per_second,
+            cached=job.stats.cached,
+            results=job.results)
+
+
+def _discard_exports(turn):
+    for result in turn.results:
+        result.discard_exports()
+
+
+class ChatHistory:
+    """The turns of one session, oldest first, bounded by turn count and total
+    text size. The oldest turns are dropped first."""
+
+    def __init__(self, max_turns=CHAT_HISTORY_MAX_TURNS, max_bytes=CHAT_HISTORY_MAX_BYTES):  # noqa: E501
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Number of turns dropped to stay within the bounds.
+        self.evicted = 0
+        self._turns = deque()
+        self._job_ids = set()
+
+    def __len__(self):
+        return len(self._turns)
+
+    def __contains__(self, job_id):
+        return job_id in self._job_ids
+
+    def record(self, job):
+        """Adds a finished answer job, once; returns its turn or None while the
+        job is still running."""
+        if job.running:
+            return None
+        if job.id in self._job_ids:
+            return next(turn for turn in reversed(self._turns) if turn.job_id == job.id)  # noqa: E501
+        return self.append(Turn.from_job(job))
+
+    def append(self, turn):
+        self._turns.append(turn)
+        self._job_ids.add(turn.job_id)
+        self.size += turn.size
+        # The newest turn is kept even if it is larger than max_bytes alone.
+        while len(self._turns) > 1 and (
+                len(self._turns) > self.max_turns or self.size > self.max_bytes):
+            evicted = self._turns.popleft()
+            _discard_exports(evicted)
+            self._job_ids.discard(evicted.job_id)
+            self.size -= evicted.size
+            self.evicted += 1
+        return turn
+
+    def window(self, count):
+        """Returns the newest `count` turns, oldest first."""
+        return list(itertools.islice(reversed(self._turns), count))[::-1]
+
+    def clear(self):
+        for turn in self._turns:
+            _discard_exports(turn)
+        self._turns.clear()
+        self._job_ids.clear()
+        self.size = 0
+        self.evicted = 0
+
+
+def get_history():
+    if "chat_history" not in st.session_state:
+        st.session_state["chat_history"] = ChatHistory()
+    return st.session_state["chat_history"]
+
+
+def outcome(turn):
+    """Returns the (kind, text) note shown under an answer, or None."""
+    if turn.state == answer_jobs.JobState.FAILED:
+        return "error", turn.error
+    if turn.state == answer_jobs.JobState.CANCELLED:
+        return "caption", "Generation stopped."
+    if turn.cached:
+        return "caption", "Answered from cache."
+    if turn.time_to_first_token is not None:
+        return "caption", f"First token after {turn.time_to_first_token:.2f}s, {turn.tokens_per_second or 0:.0f} tokens/s."  # noqa: E501
+    return None
@@ -0,0 +1,156 @@
+"""Optional on-disk cache of engine metadata responses for fast cold starts.
+
+Set ENGINE_DISK_CACHE_DIR to enable it. The first time a process needs a
+response the stored copy is returned immediately and revalidated against the
+engine in the background (stale-while-revalidate); every later load goes to the
+engine as before and refreshes the stored copy. Modules that keep what they
+built from a response in memory register with on_change() to drop it when the
+revalidation finds that the response changed.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import engine_client
+
+DISK_CACHE_DIR = os.environ.get("ENGINE_DISK_CACHE_DIR", "")
+# Stored responses older than this are not served.
+DISK_CACHE_MAX_AGE = float(os.environ.get("ENGINE_DISK_CACHE_MAX_AGE", 86400))
+
+CACHED_PATHS = (
+    "/api/v1/database-connections",
+    "/api/v1/table-descriptions",
+    "/api/v1/golden-sqls",
+    "/api/v1/instructions",
+)
+
+_local = threading.local()
+_served = set()
+_revalidating = set()
+_lock = threading.Lock()
+_revalidator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="disk-cache")
+_listeners = []
+
+
+def enabled():
+    return bool(DISK_CACHE_DIR)
+
+
+def _connection():
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+        connection = sqlite3.connect(
+            os.path.join(DISK_CACHE_DIR, "engine_cache.sqlite3"), timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " host TEXT, path TEXT, params TEXT, etag TEXT, version TEXT,"
+            " body BLOB, fetched_at REAL, PRIMARY KEY (host, path, params))")
+        _local.connection = connection
+    return connection
+
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def cacheable(path):
+    return enabled() and path.startswith(CACHED_PATHS)
+
+
+def lookup(host, path, params=None):
+    """Returns the stored body for a GET the first time this process asks for
+    it, scheduling a revalidation; otherwise None."""
+    key = (host, path, _params_key(params))
+    with _lock:
+        if key in _served:
+            return None
+        _served.add(key)
+    row = _connection().execute(
+        "SELECT etag, version, body, fetched_at FROM responses"
+        " WHERE host = ? AND path = ? AND params = ?", key).fetchone()
+    if row is None or time.time() - row[3] > DISK_CACHE_MAX_AGE:
+        return None
+    etag, version, body, _ = row
+    with _lock:
+        if key not in _revalidating:
+            _revalidating.add(key)
+            _revalidator.submit(_revalidate, key, params, etag, version)
+    return body
+
+
+def on_change(path, callback):
+    """Calls `callback(host, path, params)` from a background thread when a
+    served response for a GET under `path` turns out to be outdated."""
+    _listeners.append((path, callback))
+
+
+def _changed(host, path, params):
+    for prefix, callback in _listeners:
+        if path.startswith(prefix):
+            callback(host, path, params)
+
+
+def store(host, path, params, body, etag=None):
+    _connection().execute(
+        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (host, path, _params_key(params), etag,
+         hashlib.sha256(body).hexdigest(), body, time.time()))
+    _connection().commit()
+
+
+def store_response(host, path, params, response):
+    if response.status_code == 200:
+        store(host, path, params, response.content, response.headers.get("ETag"))
+    with _lock:
+        _served.add((host, path, _params_key(params)))
+
+
+def _revalidate(key, params, etag, version):
+    host, path, _ = key
+    try:
+        headers = {"If-None-Match": etag} if etag else {}
+        response = engine_client.get(host, path, params=params, headers=headers)
+        if response.status_code == 304 or (
+                response.status_code == 200
+                and hashlib.sha256(response.content).hexdigest() == version):
+            _connection().execute(
+                "UPDATE responses SET fetched_at = ?"
+                " WHERE host = ? AND path = ? AND params = ?", (time.time(), *key))
+            _connection().commit()
+        elif response.status_code == 200:
+            store(host, path, params, response.content, response.headers.get("ETag"))  # noqa: E501
+            _changed(host, path, params)
+    except requests.exceptions.RequestException:
+        pass
+    finally:
+        with _lock:
+            _revalidating.discard(key)
+
+
+def as_response(body, host, path):
+    """Wraps a stored body so callers can treat it like an engine response."""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    response.url = host + path
+    response.encoding = "utf-8"
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def invalidate(host=None, path=None):
+    """Forgets stored responses after the app changed them on the engine."""
+    if not enabled():
+        return
+    _connection().execute(
+        "DELETE FROM responses WHERE (? IS NULL OR host = ?) AND (? IS NULL OR path LIKE ?)",  # noqa: E501
+        (host, host, path, f"{path}%"))
+    _connection().commit()
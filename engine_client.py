@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import engine_metrics
+import engine_router
+from ttl_cache import TTLCache
+
+# Every page talks to the engine through the process-wide session below so that
+# Streamlit reruns reuse keep-alive connections instead of opening new ones.
+POOL_SIZE = int(os.environ.get("ENGINE_POOL_SIZE", 20))
+CONNECT_TIMEOUT = float(os.environ.get("ENGINE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("ENGINE_READ_TIMEOUT", 60))
+STREAM_READ_TIMEOUT = float(os.environ.get("ENGINE_STREAM_READ_TIMEOUT", 300))
+MAX_RETRIES = int(os.environ.get("ENGINE_MAX_RETRIES", 3))
+BACKOFF_FACTOR = float(os.environ.get("ENGINE_BACKOFF_FACTOR", 0.5))
+RETRY_STATUSES = (502, 503, 504)
+CONNECTIONS_CACHE_TTL = int(os.environ.get("ENGINE_CONNECTIONS_CACHE_TTL", 300))
+CONNECTIONS_CACHE_MAX_ENTRIES = int(os.environ.get("ENGINE_CONNECTIONS_CACHE_MAX_ENTRIES", 32))  # noqa: E501
+
+_sessions = {}
+_session_lock = threading.Lock()
+_connections = TTLCache(CONNECTIONS_CACHE_TTL, CONNECTIONS_CACHE_MAX_ENTRIES)
+_connections_changed_at = {}
+# Called as hook(method, path, elapsed, stream=..., response=..., error=...)
+# after every engine request, e.g. to collect metrics.
+_request_hooks = [engine_metrics.record_request]
+
+
+def _create_session(max_retries):
+    # Only idempotent methods are retried on bad statuses; POSTs are never replayed.
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE,
+        pool_maxsize=POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(retry=True):
+    # Probes such as the heartbeat pass retry=False so they fail fast instead of
+    # backing off, and get a pool of their own.
+    session = _sessions.get(retry)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(retry)
+            if session is None:
+                session = _create_session(MAX_RETRIES if retry else 0)
+                _sessions[retry] = session
+    return session
+
+
+def add_request_hook(hook):
+    _request_hooks.append(hook)
+
+
+def _run_hooks(method, path, start, stream, response=None, error=None):
+    elapsed = time.monotonic() - start
+    for hook in _request_hooks:
+        hook(method, path, elapsed, stream=stream, response=response, error=error)
+
+
+def _release_on_close(response, router, replica, elapsed):
+    # A streamed response stays in flight on its replica until it is closed but
+    # only the wait for its headers counts towards the replica's latency.
+    close = response.close
+    released = False
+
+    def release_and_close():
+        nonlocal released
+        if not released:
+            released = True
+            router.release(replica, elapsed)
+        close()
+
+    response.close = release_and_close
+
+
+def request(method, host, path, stream=False, timeout=None, retry=True, **kwargs):
+    """Sends a request to `host`, which may list several replicas of the engine.
+
+    Each request goes to one replica picked by engine_router. Streams stay on
+    the replica they started on. Idempotent requests that fail to connect or
+    get a 502/503/504 are tried on the next replica before the error is
+    returned.
+    """
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, STREAM_READ_TIMEOUT if stream else READ_TIMEOUT)
+    router = engine_router.get_router(host)
+    failover = not stream and method in Retry.DEFAULT_ALLOWED_METHODS
+    tried = []
+    while True:
+        replica = router.choose(exclude=tried)
+        tried.append(replica)
+        can_fail_over = failover and len(tried) < len(router.hosts)
+        start = time.monotonic()
+        try:
+            # Retrying the same replica is left for the last one standing.
+            response = get_session(retry and not can_fail_over).request(
+                method, replica + path, stream=stream, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            router.release(replica, time.monotonic() - start, failed=True)
+            _run_hooks(method, path, start, stream, error=e)
+            if can_fail_over and isinstance(
+                    e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):  # noqa: E501
+                continue
+            raise
+        _run_hooks(method, path, start, stream, response=response)
+        if can_fail_over and response.status_code in RETRY_STATUSES:
+            router.release(replica, time.monotonic() - start, failed=True)
+            response.close()
+            continue
+        if stream:
+            _release_on_close(response, router, replica, time.monotonic() - start)
+        else:
+            router.release(replica, time.monotonic() - start)
+        return response
+
+
+def get(host, path, **kwargs):
+    return request("GET", host, path, **kwargs)
+
+
+def post(host, path, **kwargs):
+    return request("POST", host, path, **kwargs)
+
+
+def put(host, path, **kwargs):
+    return request("PUT", host, path, **kwargs)
+
+
+def delete(host, path, **kwargs):
+    return request("DELETE", host, path, **kwargs)
+
+
+def _load_database_connections(host):
+    # Imported here because async_engine_client builds on this module.
+    import async_engine_client
+    response = async_engine_client.coalesced_get(host, "/api/v1/database-connections")
+    response.raise_for_status()
+    return {entry["alias"]: entry["id"] for entry in response.json()}
+
+
+def fetch_database_connections(host):
+    """Returns the connections of a host as alias to id. The result is shared
+    by every session of the server process, and can be loaded from a
+    background thread, e.g. to prewarm it. Failed lookups raise and are
+    therefore never cached."""
+    return _connections.get_or_load(host, lambda: _load_database_connections(host))  # noqa: E501
+
+
+def connections_changed(host, path=None, params=None):
+    """Drops the connections of `host` loaded from an outdated response. Pages
+    reload their own copy once they see `connections_changed_at`."""
+    _connections_changed_at[host] = time.time()
+    _connections.invalidate(lambda key: key == host)
+
+
+def connections_changed_at(host):
+    # The None entry is stamped when the connections of every host change.
+    return max(_connections_changed_at.get(host, 0.0), _connections_changed_at.get(None, 0.0))  # noqa: E501
+
+
+def invalidate_database_connections():
+    # Imported here because disk_cache builds on this module.
+    import disk_cache
+    disk_cache.invalidate(path="/api/v1/database-connections")
+    _connections_changed_at[None] = time.time()
+    _connections.invalidate()
+
+
+def get_all_database_connections(host):
+    try:
+        return fetch_database_connections(host)
+    except requests.exceptions.HTTPError:
+        st.warning("Could not get database connections.")
+        return {}
+    except requests.exceptions.RequestException:
+        st.error("Connection failed.")
+        return {}
+
+
+def add_database_connection(host, connection_data):
+    try:
+        response = post(host, "/api/v1/database-connections", json=connection_data)
+        if response.status_code == 200:
+            invalidate_database_connections()
+            return response.json()
+        return None
+    except requests.exceptions.RequestException:
+        return None
@@ -0,0 +1,224 @@
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+
+# Upper bounds in seconds, as in a Prometheus histogram.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))  # noqa: E501
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[\w-]{8,}$")
+
+
+def endpoint_name(path):
+    """Collapses ids in a path so every golden record, instruction or table
+    shares one endpoint, e.g. /api/v1/golden-sqls/{id}."""
+    path = path.split("?", 1)[0]
+    return "/".join("{id}" if _ID_SEGMENT.match(segment) else segment
+                    for segment in path.split("/"))
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Estimates a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},  # noqa: E501
+        }
+
+
+class EngineMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.request_count = 0
+            self.latency = defaultdict(Histogram)
+            self.time_to_first_chunk = defaultdict(Histogram)
+            self.reruns = defaultdict(Histogram)
+            self.statuses = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.retries = defaultdict(int)
+            self.request_bytes = defaultdict(int)
+            self.response_bytes = defaultdict(int)
+
+    def record_request(self, method, path, elapsed, request_bytes=0,
+                       response_bytes=0, status=None, retries=0, error=None):
+        key = (method, endpoint_name(path))
+        with self._lock:
+            self.request_count += 1
+            self.latency[key].observe(elapsed)
+            self.request_bytes[key] += request_bytes
+            self.response_bytes[key] += response_bytes
+            self.retries[key] += retries
+            if status is not None:
+                self.statuses[key + (status,)] += 1
+            if error is not None:
+                self.errors[key + (type(error).__name__,)] += 1
+
+    def record_stream(self, method, path, time_to_first_chunk, response_bytes):
+        key = (method, endpoint_name(path))
+        with self._lock:
+            if time_to_first_chunk is not None:
+                self.time_to_first_chunk[key].observe(time_to_first_chunk)
+            self.response_bytes[key] += response_bytes
+
+    def record_rerun(self, page, elapsed):
+        with self._lock:
+            self.reruns[page].observe(elapsed)
+
+    def endpoint_rows(self):
+        with self._lock:
+            rows = []
+            for key, histogram in sorted(self.latency.items()):
+                first_chunk = self.time_to_first_chunk.get(key)
+                rows.append({
+                    "method": key[0],
+                    "endpoint": key[1],
+                    "requests": histogram.count,
+                    "mean_s": histogram.sum / histogram.count,
+                    "p50_s": histogram.quantile(0.5),
+                    "p95_s": histogram.quantile(0.95),
+                    "first_chunk_p50_s": first_chunk.quantile(0.5) if first_chunk else None,  # noqa: E501
+                    "errors": sum(count for error_key, count in self.errors.items() if error_key[:2] == key),  # noqa: E501
+                    "retries": self.retries[key],
+                    "request_bytes": self.request_bytes[key],
+                    "response_bytes": self.response_bytes[key],
+                })
+            return rows
+
+    def rerun_rows(self):
+        with self._lock:
+            return [{
+                "page": page,
+                "reruns": histogram.count,
+                "mean_s": histogram.sum / histogram.count,
+                "p50_s": histogram.quantile(0.5),
+                "p95_s": histogram.quantile(0.95),
+            } for page, histogram in sorted(self.reruns.items())]
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "requests": [
+                    {"method": key[0], "endpoint": key[1], "latency": histogram.to_dict(),  # noqa: E501
+                     "time_to_first_chunk": self.time_to_first_chunk[key].to_dict() if key in self.time_to_first_chunk else None,  # noqa: E501
+                     "request_bytes": self.request_bytes[key],
+                     "response_bytes": self.response_bytes[key],
+                     "retries": self.retries[key]}
+                    for key, histogram in sorted(self.latency.items())],
+                "statuses": [
+                    {"method": key[0], "endpoint": key[1], "status": key[2], "count": count}  # noqa: E501
+                    for key, count in sorted(self.statuses.items())],
+                "errors": [
+                    {"method": key[0], "endpoint": key[1], "error": key[2], "count": count}  # noqa: E501
+                    for key, count in sorted(self.errors.items())],
+                "reruns": [
+                    {"page": page, "duration": histogram.to_dict()}
+                    for page, histogram in sorted(self.reruns.items())],
+            }
+
+    def to_prometheus(self):
+        lines = []
+
+        def histogram_lines(name, help_text, histograms, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(histograms.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                labels = ",".join(f'{label}="{label_value}"' for label, label_value in zip(label_names, key))  # noqa: E501
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        def counter_lines(name, help_text, counters, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(counters.items()):
+                labels = ",".join(f'{label}="{label_value}"' for label, label_value in zip(label_names, key))  # noqa: E501
+                lines.append(f"{name}{{{labels}}} {value}")
+
+        with self._lock:
+            endpoint_labels = ("method", "endpoint")
+            histogram_lines("dataherald_app_engine_request_seconds", "Engine request latency; for streamed responses until the headers arrive.", self.latency, endpoint_labels)  # noqa: E501
+            histogram_lines("dataherald_app_engine_first_chunk_seconds", "Time until the first chunk of a streamed engine response.", self.time_to_first_chunk, endpoint_labels)  # noqa: E501
+            histogram_lines("dataherald_app_rerun_seconds", "Streamlit page script run time.", self.reruns, ("page",))  # noqa: E501
+            counter_lines("dataherald_app_engine_responses_total", "Engine responses by status code.", self.statuses, endpoint_labels + ("status",))  # noqa: E501
+            counter_lines("dataherald_app_engine_errors_total", "Engine requests that failed without a response.", self.errors, endpoint_labels + ("error",))  # noqa: E501
+            counter_lines("dataherald_app_engine_retries_total", "Retries made by the HTTP client.", self.retries, endpoint_labels)  # noqa: E501
+            counter_lines("dataherald_app_engine_request_bytes_total", "Bytes sent to the engine.", self.request_bytes, endpoint_labels)  # noqa: E501
+            counter_lines("dataherald_app_engine_response_bytes_total", "Bytes received from the engine.", self.response_bytes, endpoint_labels)  # noqa: E501
+        return "\n".join(lines) + "\n"
+
+
+metrics = EngineMetrics()
+_rerun = threading.local()
+
+
+def record_request(method, path, elapsed, stream=False, response=None, error=None):
+    """Request hook for engine_client."""
+    request_bytes = 0
+    response_bytes = 0
+    status = None
+    retries = 0
+    if response is not None:
+        body = response.request.body
+        request_bytes = len(body) if isinstance(body, (bytes, str)) else 0
+        # Streamed bodies are counted by record_stream as they are read.
+        if not stream:
+            response_bytes = len(response.content)
+        status = response.status_code
+        history = getattr(getattr(response.raw, "retries", None), "history", None)
+        retries = len(history) if history else 0
+    metrics.record_request(
+        method, path, elapsed, request_bytes, response_bytes, status, retries, error)
+
+
+def start_rerun(page):
+    """Marks the start of a page script run; pair with finish_rerun() at the end
+    of the script. Runs that end early with st.stop() are not recorded."""
+    # Imported here because the profiler reads the request count from this module.
+    import rerun_profiler
+    _rerun.page = page
+    _rerun.started_at = time.monotonic()
+    rerun_profiler.start(page)
+
+
+def finish_rerun():
+    import rerun_profiler
+    page = getattr(_rerun, "page", None)
+    if page is not None:
+        metrics.record_rerun(page, time.monotonic() - _rerun.started_at)
+        _rerun.page = None
+    rerun_profiler.finish()
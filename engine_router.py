@@ -0,0 +1,100 @@
+import os
+import random
+import re
+import threading
+
+# Weight of the newest response time in each replica's moving average latency.
+EWMA_ALPHA = float(os.environ.get("ENGINE_ROUTER_EWMA_ALPHA", 0.3))
+# Seconds counted as the response time of a request that failed, so a failing
+# replica loses traffic before its heartbeat notices.
+FAILURE_PENALTY = float(os.environ.get("ENGINE_ROUTER_FAILURE_PENALTY", 5))
+
+_HOST_SEPARATOR = re.compile(r"[\s,]+")
+
+
+def parse_hosts(host):
+    """Splits an engine URI setting into its replicas; several replicas of one
+    engine are given separated by commas."""
+    return tuple(replica.rstrip("/") for replica in _HOST_SEPARATOR.split(host or "") if replica) or (host,)  # noqa: E501
+
+
+class _Replica:
+    __slots__ = ("host", "in_flight", "latency")
+
+    def __init__(self, host):
+        self.host = host
+        self.in_flight = 0
+        # Moving average of response times; None until the first response.
+        self.latency = None
+
+
+class Router:
+    """Picks the replica for each engine request.
+
+    Replicas whose heartbeat reports them down are skipped while any other is
+    up. Among the rest the one with the lowest expected wait wins: its moving
+    average latency times the requests already in flight to it, plus one.
+    Replicas without a measured latency are tried first.
+    """
+
+    def __init__(self, hosts):
+        self._lock = threading.Lock()
+        self._replicas = {host: _Replica(host) for host in hosts}
+
+    @property
+    def hosts(self):
+        return list(self._replicas)
+
+    def _healthy(self, host):
+        # Imported here because heartbeat builds on engine_client, which routes
+        # through this module.
+        import heartbeat
+        return heartbeat.get_engine_health(host).healthy is not False
+
+    def choose(self, exclude=()):
+        """Returns the replica for the next request and counts it as in flight
+        until release() is called, or None when every replica is excluded."""
+        candidates = [replica for host, replica in self._replicas.items() if host not in exclude]  # noqa: E501
+        if not candidates:
+            return None
+        if len(self._replicas) > 1:
+            healthy = [replica for replica in candidates if self._healthy(replica.host)]  # noqa: E501
+            candidates = healthy or candidates
+        with self._lock:
+            replica = min(
+                candidates,
+                key=lambda replica: (
+                    replica.latency is not None,
+                    (replica.latency or 0) * (replica.in_flight + 1),
+                    random.random()))
+            replica.in_flight += 1
+        return replica.host
+
+    def release(self, host, elapsed, failed=False):
+        """Marks a request to `host` as finished after `elapsed` seconds."""
+        if failed:
+            elapsed = max(elapsed, FAILURE_PENALTY)
+        with self._lock:
+            replica = self._replicas[host]
+            replica.in_flight -= 1
+            replica.latency = elapsed if replica.latency is None else (
+                EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * replica.latency)
+
+    def stats(self):
+        with self._lock:
+            return [{"host": replica.host, "in_flight": replica.in_flight, "latency": replica.latency}  # noqa: E501
+                    for replica in self._replicas.values()]
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(host):
+    router = _routers.get(host)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(host)
+            if router is None:
+                router = _routers[host] = Router(parse_hosts(host))
+    return router
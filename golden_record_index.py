@@ -0,0 +1,273 @@
+import collections
+import math
+import os
+import re
+import threading
+import time
+from array import array
+
+import disk_cache
+import golden_records
+import record_frames
+
+# How long an index built from the engine is trusted before it is rebuilt. Changes
+# made from this app are applied incrementally and do not need a rebuild.
+INDEX_TTL = int(os.environ.get("GOLDEN_RECORDS_INDEX_TTL", 600))
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("GOLDEN_RECORDS_NEAR_DUPLICATE_THRESHOLD", 0.8))  # noqa: E501
+# Most records scored for similarity when a golden record is added.
+NEAR_DUPLICATE_CANDIDATES = int(os.environ.get("GOLDEN_RECORDS_NEAR_DUPLICATE_CANDIDATES", 50))  # noqa: E501
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _tokens(question, sql_query):
+    return set(_TOKEN_PATTERN.findall(question)) | set(_TOKEN_PATTERN.findall(sql_query))  # noqa: E501
+
+
+class GoldenRecordIndex:
+    """Trigram index over the question and SQL of golden records.
+
+    Only postings are kept: trigrams and records are numbered, and each
+    trigram maps to an array of the numbers of the records containing it. The
+    trigrams of a record are computed again when it is removed. A search only
+    touches the records that share every trigram of the query and ranks them by
+    where and how well the query matched.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Record number -> (record, normalized question, normalized SQL), or
+        # None once removed.
+        self._documents = []
+        self._numbers = {}
+        self._trigram_ids = {}
+        # Trigram id -> record numbers, ascending; for the question and SQL,
+        # and for the question alone.
+        self._postings = []
+        self._question_postings = []
+        # Word -> record numbers, for ranking.
+        self._token_postings = {}
+        self.ready = threading.Event()
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def _trigram_id(self, trigram):
+        trigram_id = self._trigram_ids.get(trigram)
+        if trigram_id is None:
+            trigram_id = self._trigram_ids[trigram] = len(self._postings)
+            self._postings.append(array("I"))
+            self._question_postings.append(array("I"))
+        return trigram_id
+
+    def add(self, record):
+        # Only what a search result shows is kept of the record.
+        record = {column: record.get(column) for column in record_frames.GOLDEN_RECORD_COLUMNS}  # noqa: E501
+        question = normalize(record.get("question"))
+        sql_query = normalize(record.get("sql_query"))
+        question_trigrams = trigrams(question)
+        sql_trigrams = trigrams(sql_query)
+        with self._lock:
+            self._remove(record["id"])
+            number = self._numbers[record["id"]] = len(self._documents)
+            self._documents.append((record, question, sql_query))
+            question_ids = {self._trigram_id(trigram) for trigram in question_trigrams}
+            for trigram_id in question_ids:
+                self._question_postings[trigram_id].append(number)
+            question_ids.update(self._trigram_id(trigram) for trigram in sql_trigrams)
+            for trigram_id in question_ids:
+                self._postings[trigram_id].append(number)
+            for token in _tokens(question, sql_query):
+                self._token_postings.setdefault(token, array("I")).append(number)
+
+    def remove(self, record_id):
+        with self._lock:
+            self._remove(record_id)
+
+    def _remove(self, record_id):
+        number = self._numbers.pop(record_id, None)
+        if number is None:
+            return
+        _, question, sql_query = self._documents[number]
+        self._documents[number] = None
+        question_trigrams = trigrams(question)
+        for trigram in question_trigrams | trigrams(sql_query):
+            trigram_id = self._trigram_ids[trigram]
+            self._postings[trigram_id].remove(number)
+            if trigram in question_trigrams:
+                self._question_postings[trigram_id].remove(number)
+        for token in _tokens(question, sql_query):
+            numbers = self._token_postings[token]
+            numbers.remove(number)
+            if not numbers:
+                del self._token_postings[token]
+
+    def _candidates(self, query_trigrams):
+        postings = []
+        for trigram in query_trigrams:
+            trigram_id = self._trigram_ids.get(trigram)
+            if trigram_id is None:
+                return set()
+            postings.append(self._postings[trigram_id])
+        if not postings:
+            return set(self._numbers.values())
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for numbers in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(numbers)
+        return candidates
+
+    def search(self, search_query):
+        """Returns the records whose question or SQL contains `search_query`,
+        best matches first."""
+        query = normalize(search_query)
+        if not query:
+            return []
+        # Only unpadded windows are guaranteed to occur in a text containing the query.
+        query_trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+        # Number of words of the query each record contains.
+        shared_tokens = collections.Counter()
+        with self._lock:
+            for token in set(_TOKEN_PATTERN.findall(query)):
+                shared_tokens.update(self._token_postings.get(token, ()))
+            documents = [(number, self._documents[number])
+                         for number in self._candidates(query_trigrams)]
+        ranked = []
+        records = {}
+        for number, (record, question, sql_query) in documents:
+            in_question = query in question
+            if not in_question and query not in sql_query:
+                continue
+            records[number] = record
+            ranked.append((not in_question, -shared_tokens[number], len(question), question, number))  # noqa: E501
+        ranked.sort()
+        return [records[item[4]] for item in ranked]
+
+    def near_duplicates(self, question, threshold=NEAR_DUPLICATE_THRESHOLD,
+                        limit=NEAR_DUPLICATE_CANDIDATES):
+        """Returns (record, score) pairs whose question is at least `threshold`
+        similar to `question`, most similar first.
+
+        A record that similar shares all but a few of the question's trigrams,
+        so candidates are only collected from the postings of the rarest ones.
+        The `limit` candidates sharing most of them are scored.
+        """
+        question_trigrams = trigrams(normalize(question))
+        # Trigrams a record must share with the question to reach `threshold`.
+        required = max(math.ceil(threshold * len(question_trigrams)), 1)
+        overlap = collections.Counter()
+        with self._lock:
+            postings = sorted(
+                (self._question_postings[self._trigram_ids[trigram]]
+                 for trigram in question_trigrams if trigram in self._trigram_ids),  # noqa: E501
+                key=len)
+            for numbers in postings[:len(question_trigrams) - required + 1]:
+                overlap.update(numbers)
+            documents = [self._documents[number] for number, _ in overlap.most_common(limit)]  # noqa: E501
+        scored = []
+        for record, record_question, _ in documents:
+            score = similarity(question_trigrams, trigrams(record_question))
+            if score >= threshold:
+                scored.append((record, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+
+_indexes = {}
+_rebuilding = {}
+_indexes_lock = threading.Lock()
+
+
+def _build(key, index):
+    host, db_connection_id = key
+    try:
+        for record in golden_records.iter_all(host, db_connection_id):
+            index.add(record)
+        index.built_at = time.monotonic()
+        index.ready.set()
+        with _indexes_lock:
+            _indexes[key] = index
+    except Exception:
+        # A failed first build is forgotten so the next lookup starts over.
+        with _indexes_lock:
+            if _indexes.get(key) is index:
+                del _indexes[key]
+    finally:
+        with _indexes_lock:
+            if _rebuilding.get(key) is index:
+                del _rebuilding[key]
+
+
+def _start_build(key):
+    index = _rebuilding[key] = GoldenRecordIndex()
+    threading.Thread(
+        target=_build,
+        args=(key, index),
+        name=f"golden-record-index-{key[1]}",
+        daemon=True).start()
+    return index
+
+
+def get_index(host, db_connection_id):
+    """Returns the index for a connection, building it in the background when it
+    is missing. Call it only to search, so pages that never search do not load
+    every record. A stale index keeps serving until its replacement is ready,
+    so callers should only check `index.ready` before searching."""
+    key = (host, db_connection_id)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = _start_build(key)
+        elif (index.ready.is_set() and key not in _rebuilding
+              and time.monotonic() - index.built_at > INDEX_TTL):
+            _start_build(key)
+        return index
+
+
+def _indexes_for(host, db_connection_id=None):
+    with _indexes_lock:
+        indexes = {id(index): index
+                   for registry in (_indexes, _rebuilding)
+                   for key, index in registry.items()
+                   if key[0] == host and db_connection_id in (None, key[1])}
+    return list(indexes.values())
+
+
+def _expire(host, path, params):
+    for index in _indexes_for(host, (params or {}).get("db_connection_id")):
+        if index.ready.is_set():
+            # Rebuilt by the next get_index().
+            index.built_at = float("-inf")
+
+
+disk_cache.on_change("/api/v1/golden-sqls", _expire)
+
+
+def add_records(host, db_connection_id, records):
+    records = [record for record in records if "id" in record]
+    for index in _indexes_for(host, db_connection_id):
+        for record in records:
+            index.add(record)
+
+
+def remove_record(host, record_id):
+    for index in _indexes_for(host):
+        index.remove(record_id)
@@ -0,0 +1,245 @@
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import List, Optional
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+import engine_client
+import golden_records
+
+UPLOAD_BATCH_SIZE = int(os.environ.get("GOLDEN_RECORDS_UPLOAD_BATCH_SIZE", 500))
+UPLOAD_CONCURRENCY = int(os.environ.get("GOLDEN_RECORDS_UPLOAD_CONCURRENCY", 4))
+UPLOAD_MAX_ATTEMPTS = int(os.environ.get("GOLDEN_RECORDS_UPLOAD_MAX_ATTEMPTS", 3))
+UPLOAD_RETRY_BACKOFF = float(os.environ.get("GOLDEN_RECORDS_UPLOAD_RETRY_BACKOFF", 1))  # noqa: E501
+# Responses of a gateway that did not reach the engine, so nothing was inserted.
+UPLOAD_RETRY_STATUSES = (502, 503)
+# Lines listed in the diff of an upload; the counts cover every line.
+UPLOAD_DIFF_ROWS = int(os.environ.get("GOLDEN_RECORDS_UPLOAD_DIFF_ROWS", 1000))
+
+
+class BatchUploadError(Exception):
+    pass
+
+
+@dataclass
+class RejectedLine:
+    line_number: int
+    reason: str
+
+
+class DiffStatus:
+    # Not among the existing golden records.
+    NEW = "new"
+    # An existing golden record has the same question with other SQL.
+    CHANGED = "changed"
+    # An existing golden record has the same question and SQL.
+    DUPLICATE = "duplicate"
+    # An earlier line of the file has the same question and SQL.
+    REPEATED = "repeated"
+
+
+@dataclass
+class DiffLine:
+    line_number: int
+    status: str
+    prompt_text: str
+    existing_id: Optional[str] = None
+
+
+@dataclass
+class FailedBatch:
+    first_line: int
+    last_line: int
+    error: str
+
+
+@dataclass
+class UploadReport:
+    uploaded: int = 0
+    bytes_read: int = 0
+    elapsed: float = 0.0
+    rejected: List[RejectedLine] = field(default_factory=list)
+    failed_batches: List[FailedBatch] = field(default_factory=list)
+    # Lines per DiffStatus, and the first UPLOAD_DIFF_ROWS of them.
+    statuses: Counter = field(default_factory=Counter)
+    diff: List[DiffLine] = field(default_factory=list)
+
+    @property
+    def skipped(self):
+        return self.statuses[DiffStatus.DUPLICATE] + self.statuses[DiffStatus.REPEATED]  # noqa: E501
+
+    @property
+    def records_per_second(self):
+        return self.uploaded / self.elapsed if self.elapsed else 0.0
+
+
+def parse_lines(lines, db_connection_id, report):
+    """Lazily turns JSONL lines into golden record payloads.
+
+    Yields (line_number, record) pairs; invalid lines are added to
+    `report.rejected` instead of stopping the upload.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        report.bytes_read += len(line)
+        if isinstance(line, bytes):
+            try:
+                line = line.decode("utf-8")
+            except UnicodeDecodeError as e:
+                report.rejected.append(RejectedLine(line_number, f"Invalid UTF-8: {e}"))  # noqa: E501
+                continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            line_data = json.loads(line)
+        except json.JSONDecodeError as e:
+            report.rejected.append(RejectedLine(line_number, f"Invalid JSON: {e}"))
+            continue
+        if not isinstance(line_data, dict):
+            report.rejected.append(RejectedLine(line_number, "Line is not a JSON object"))  # noqa: E501
+            continue
+        missing = [key for key in ("prompt_text", "sql")
+                   if not isinstance(line_data.get(key), str) or not line_data[key].strip()]  # noqa: E501
+        if missing:
+            report.rejected.append(RejectedLine(line_number, f"Missing {', '.join(missing)}"))  # noqa: E501
+            continue
+        yield line_number, {
+            "db_connection_id": db_connection_id,
+            "prompt_text": line_data["prompt_text"],
+            "sql": line_data["sql"]
+        }
+
+
+def deduplicate(numbered_records, existing, report):
+    """Drops records that repeat an earlier line or, if `existing` fingerprints
+    are given, an existing golden record, and adds every line to the diff."""
+    seen = set()
+    for line_number, record in numbered_records:
+        key = golden_records.fingerprint(record["prompt_text"], record["sql"])
+        existing_id = None
+        if key in seen:
+            status = DiffStatus.REPEATED
+        elif existing is not None and key in existing.pairs:
+            status, existing_id = DiffStatus.DUPLICATE, existing.pairs[key]
+        else:
+            seen.add(key)
+            existing_id = existing.questions.get(
+                golden_records.question_key(record["prompt_text"])) if existing is not None else None  # noqa: E501
+            status = DiffStatus.CHANGED if existing_id is not None else DiffStatus.NEW  # noqa: E501
+        report.statuses[status] += 1
+        if len(report.diff) < UPLOAD_DIFF_ROWS:
+            report.diff.append(DiffLine(line_number, status, record["prompt_text"], existing_id))  # noqa: E501
+        if status in (DiffStatus.NEW, DiffStatus.CHANGED):
+            yield line_number, record
+
+
+def dry_run(db_connection_id, lines, existing=None):
+    """Reports what upload() would send without sending anything."""
+    report = UploadReport()
+    start = time.monotonic()
+    for _ in deduplicate(parse_lines(lines, db_connection_id, report), existing, report):  # noqa: E501
+        pass
+    report.elapsed = time.monotonic() - start
+    return report
+
+
+def _batches(numbered_records, batch_size):
+    iterator = iter(numbered_records)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _not_sent(error):
+    """Whether a request failed before any of it was sent: the connection could
+    not be opened, e.g. refused, timed out or the host name did not resolve. A
+    connection dropped later, e.g. "Connection aborted.", may follow a request
+    the engine has already received."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    # requests wraps urllib3's MaxRetryError, whose reason is the actual error.
+    reason = getattr(error.args[0], "reason", error.args[0])
+    # Includes NameResolutionError.
+    return isinstance(reason, NewConnectionError)
+
+
+def _post_batch(host, batch):
+    """Posts one batch, retrying only when the engine cannot have inserted it:
+    the request was never sent or the gateway answered that the engine is
+    down. After any other error the batch may have been inserted, so a retry
+    could duplicate it and it is reported as failed instead."""
+    payload = [record for _, record in batch]
+    error = None
+    for attempt in range(UPLOAD_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(UPLOAD_RETRY_BACKOFF * 2 ** (attempt - 1))
+        try:
+            response = engine_client.post(host, "/api/v1/golden-sqls", json=payload)
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+            if _not_sent(e):
+                continue
+            break
+        if response.status_code == 201:
+            created = response.json()
+            return created if isinstance(created, list) else []
+        error = f"HTTP {response.status_code}: {response.text}"
+        if response.status_code not in UPLOAD_RETRY_STATUSES:
+            break
+    raise BatchUploadError(error)
+
+
+def upload(host, db_connection_id, lines, batch_size=UPLOAD_BATCH_SIZE,
+           concurrency=UPLOAD_CONCURRENCY, on_progress=None, on_batch=None,
+           existing=None):
+    """Uploads golden records from JSONL `lines` in concurrent batches.
+
+    Lines repeating an earlier line are skipped, as are lines matching the
+    `existing` fingerprints of the connection's golden records when given.
+
+    At most `concurrency` batches are in flight and only twice that many are
+    parsed ahead, so memory stays bounded for arbitrarily large files.
+    `on_progress(report)` and `on_batch(created_records)` are called from the
+    calling thread after every finished batch.
+    """
+    report = UploadReport()
+    start = time.monotonic()
+    batches = _batches(
+        deduplicate(parse_lines(lines, db_connection_id, report), existing, report),  # noqa: E501
+        batch_size)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="golden-record-upload") as executor:  # noqa: E501
+        in_flight = {}
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < concurrency * 2:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                else:
+                    in_flight[executor.submit(_post_batch, host, batch)] = batch
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    created = future.result()
+                    report.uploaded += len(batch)
+                    if on_batch is not None:
+                        on_batch(created)
+                except BatchUploadError as e:
+                    report.failed_batches.append(
+                        FailedBatch(batch[0][0], batch[-1][0], str(e)))
+            report.elapsed = time.monotonic() - start
+            if on_progress is not None:
+                on_progress(report)
+    report.failed_batches.sort(key=lambda failed_batch: failed_batch.first_line)
+    return report
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict
+
+import answer_cache
+import async_engine_client
+import disk_cache
+import record_frames
+from ttl_cache import TTLCache
+
+GOLDEN_RECORDS_CACHE_TTL = int(os.environ.get("GOLDEN_RECORDS_CACHE_TTL", 60))
+GOLDEN_RECORDS_CACHE_MAX_PAGES = int(os.environ.get("GOLDEN_RECORDS_CACHE_MAX_PAGES", 256))  # noqa: E501
+# Page size used when scanning golden records for a search query.
+SEARCH_SCAN_LIMIT = int(os.environ.get("GOLDEN_RECORDS_SEARCH_SCAN_LIMIT", 500))
+
+_pages = TTLCache(GOLDEN_RECORDS_CACHE_TTL, GOLDEN_RECORDS_CACHE_MAX_PAGES)
+_frames = TTLCache(GOLDEN_RECORDS_CACHE_TTL, GOLDEN_RECORDS_CACHE_MAX_PAGES)
+_counts = TTLCache(GOLDEN_RECORDS_CACHE_TTL, GOLDEN_RECORDS_CACHE_MAX_PAGES)
+_fingerprints = TTLCache(GOLDEN_RECORDS_CACHE_TTL, 16)
+_counting = set()
+_counting_lock = threading.Lock()
+_prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="golden-records")
+
+
+def _load_page(host, db_connection_id, page, limit):
+    params = {
+        "db_connection_id": db_connection_id,
+        "page": page,
+        "limit": limit
+    }
+    response = async_engine_client.coalesced_get(host, "/api/v1/golden-sqls", params=params)  # noqa: E501
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_page(host, db_connection_id, page, limit):
+    return _pages.get_or_load(
+        (host, db_connection_id, page, limit),
+        lambda: _load_page(host, db_connection_id, page, limit))
+
+
+def prefetch_page(host, db_connection_id, page, limit):
+    if (host, db_connection_id, page, limit) not in _pages:
+        _prefetcher.submit(fetch_page, host, db_connection_id, page, limit)
+
+
+def fetch_frame(host, db_connection_id, page, limit):
+    """Returns a page of golden records as a frame of the columns the page
+    shows, decoded from the response without building a list of records."""
+    params = {
+        "db_connection_id": db_connection_id,
+        "page": page,
+        "limit": limit
+    }
+    return _frames.get_or_load(
+        (host, db_connection_id, page, limit),
+        lambda: record_frames.fetch_frame(
+            host, "/api/v1/golden-sqls", params, record_frames.GOLDEN_RECORD_COLUMNS))  # noqa: E501
+
+
+def prefetch_frame(host, db_connection_id, page, limit):
+    if (host, db_connection_id, page, limit) not in _frames:
+        _prefetcher.submit(fetch_frame, host, db_connection_id, page, limit)
+
+
+def _has_record(host, db_connection_id, position):
+    # Not through fetch_page: these one-record probes would push real pages out
+    # of the shared cache.
+    return len(_load_page(host, db_connection_id, position, 1)) > 0
+
+
+def _count(host, db_connection_id):
+    # With limit=1 page N holds the N-th record, so the count is the last
+    # non-empty page. Gallop to an upper bound, then binary search, downloading
+    # at most one record per probe.
+    if not _has_record(host, db_connection_id, 1):
+        return 0
+    low, high = 1, 2
+    while _has_record(host, db_connection_id, high):
+        low, high = high, high * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if _has_record(host, db_connection_id, middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def count(host, db_connection_id):
+    return _counts.get_or_load(
+        (host, db_connection_id),
+        lambda: _count(host, db_connection_id))
+
+
+def _count_in_background(key):
+    try:
+        count(*key)
+    except Exception:
+        # Counting is retried the next time the count is asked for.
+        pass
+    finally:
+        with _counting_lock:
+            _counting.discard(key)
+
+
+def cached_count(host, db_connection_id):
+    """Returns the number of golden records if it is known, otherwise None
+    after starting to count them in the background."""
+    key = (host, db_connection_id)
+    total = _counts.get(key)
+    if total is None:
+        with _counting_lock:
+            if key not in _counting:
+                _counting.add(key)
+                _prefetcher.submit(_count_in_background, key)
+    return total
+
+
+def _digest(*texts):
+    return hashlib.blake2b("\0".join(texts).encode("utf-8"), digest_size=16).digest()
+
+
+def _normalize_sql(sql):
+    # Literals are case sensitive, so only whitespace and the final semicolon
+    # are normalized.
+    return " ".join((sql or "").split()).rstrip("; ")
+
+
+def question_key(question):
+    return _digest(answer_cache.normalize_question(question))
+
+
+def fingerprint(question, sql):
+    """Identifies a golden record by its normalized question and SQL."""
+    return _digest(answer_cache.normalize_question(question), _normalize_sql(sql))
+
+
+@dataclass
+class Fingerprints:
+    # Fingerprint of question and SQL to record id.
+    pairs: Dict[bytes, str] = field(default_factory=dict)
+    # Fingerprint of the question alone to record id.
+    questions: Dict[bytes, str] = field(default_factory=dict)
+
+    def add(self, record):
+        self.pairs[fingerprint(record.get("question"), record.get("sql_query"))] = record["id"]  # noqa: E501
+        self.questions[question_key(record.get("question"))] = record["id"]
+
+
+def iter_all(host, db_connection_id):
+    """Yields every golden record of a connection as the pages stream in,
+    without keeping the pages in the page cache."""
+    page = 1
+    while True:
+        params = {
+            "db_connection_id": db_connection_id,
+            "page": page,
+            "limit": SEARCH_SCAN_LIMIT
+        }
+        received = 0
+        for record in record_frames.iter_records(host, "/api/v1/golden-sqls", params):  # noqa: E501
+            received += 1
+            yield record
+        if received < SEARCH_SCAN_LIMIT:
+            return
+        page += 1
+
+
+def _load_fingerprints(host, db_connection_id):
+    fingerprints = Fingerprints()
+    for record in iter_all(host, db_connection_id):
+        fingerprints.add(record)
+    return fingerprints
+
+
+def fingerprints(host, db_connection_id):
+    """Returns the fingerprints of all golden records of a connection. Only the
+    digests are kept, so this stays small for large connections."""
+    return _fingerprints.get_or_load(
+        (host, db_connection_id),
+        lambda: _load_fingerprints(host, db_connection_id))
+
+
+def _matches(record, search_query):
+    return (search_query in record["question"].lower()
+            or search_query in record["sql_query"].lower())
+
+
+def search(host, db_connection_id, search_query, page, limit):
+    """Returns the requested page of records matching `search_query`.
+
+    The engine cannot filter golden records, so pages are scanned lazily and the
+    scan stops as soon as the requested page is filled.
+    """
+    search_query = search_query.lower()
+    needed = page * limit
+    matches = []
+    scan_page = 1
+    while len(matches) < needed:
+        records = fetch_page(host, db_connection_id, scan_page, SEARCH_SCAN_LIMIT)
+        matches.extend(record for record in records if _matches(record, search_query))
+        if len(records) < SEARCH_SCAN_LIMIT:
+            return matches[(page - 1) * limit:needed]
+        scan_page += 1
+    prefetch_page(host, db_connection_id, scan_page, SEARCH_SCAN_LIMIT)
+    return matches[(page - 1) * limit:needed]
+
+
+def _forget(host, db_connection_id=None):
+    _pages.invalidate(
+        lambda key: key[0] == host and db_connection_id in (None, key[1]))
+    _frames.invalidate(
+        lambda key: key[0] == host and db_connection_id in (None, key[1]))
+    _counts.invalidate(
+        lambda key: key[0] == host and db_connection_id in (None, key[1]))
+    _fingerprints.invalidate(
+        lambda key: key[0] == host and db_connection_id in (None, key[1]))
+
+
+def invalidate(host, db_connection_id=None):
+    disk_cache.invalidate(host, "/api/v1/golden-sqls")
+    _forget(host, db_connection_id)
+
+
+disk_cache.on_change(
+    "/api/v1/golden-sqls",
+    lambda host, path, params: _forget(host, (params or {}).get("db_connection_id")))  # noqa: E501
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+import engine_client
+import engine_router
+
+HEARTBEAT_INTERVAL = float(os.environ.get("ENGINE_HEARTBEAT_INTERVAL", 10))
+HEARTBEAT_TIMEOUT = float(os.environ.get("ENGINE_HEARTBEAT_TIMEOUT", 3))
+# Consecutive failed probes before the circuit opens, and how long it stays open
+# before a single trial probe is allowed through.
+FAILURE_THRESHOLD = int(os.environ.get("ENGINE_HEARTBEAT_FAILURE_THRESHOLD", 3))
+RECOVERY_TIMEOUT = float(os.environ.get("ENGINE_HEARTBEAT_RECOVERY_TIMEOUT", 30))
+# A monitor nobody has read from for this long stops probing until it is read again.
+IDLE_TIMEOUT = float(os.environ.get("ENGINE_HEARTBEAT_IDLE_TIMEOUT", 300))
+
+
+class CircuitState:
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+@dataclass(frozen=True)
+class EngineHealth:
+    healthy: Optional[bool]
+    checked_at: Optional[float]
+    circuit: str
+    consecutive_failures: int
+    latency: Optional[float]
+    error: Optional[str]
+
+
+class HeartbeatMonitor:
+    """Probes one engine host in a background thread and keeps the last result."""
+
+    def __init__(self, host):
+        self.host = host
+        self._lock = threading.Lock()
+        self._first_probe = threading.Event()
+        self._thread = None
+        self._last_read = time.monotonic()
+        self._opened_at = 0.0
+        self._health = EngineHealth(
+            healthy=None,
+            checked_at=None,
+            circuit=CircuitState.CLOSED,
+            consecutive_failures=0,
+            latency=None,
+            error=None)
+
+    def status(self, wait=0):
+        self._last_read = time.monotonic()
+        self._ensure_running()
+        if wait and not self._first_probe.is_set():
+            self._first_probe.wait(wait)
+        return self._health
+
+    def probe(self):
+        start = time.monotonic()
+        try:
+            response = engine_client.get(
+                self.host,
+                "/api/v1/heartbeat",
+                timeout=(engine_client.CONNECT_TIMEOUT, HEARTBEAT_TIMEOUT),
+                retry=False)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"  # noqa: E501
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        self._record(error, time.monotonic() - start)
+        return self._health
+
+    def _record(self, error, latency):
+        with self._lock:
+            health = self._health
+            if error is None:
+                circuit = CircuitState.CLOSED
+                failures = 0
+            else:
+                failures = health.consecutive_failures + 1
+                if health.circuit == CircuitState.HALF_OPEN or failures >= FAILURE_THRESHOLD:  # noqa: E501
+                    circuit = CircuitState.OPEN
+                    self._opened_at = time.monotonic()
+                else:
+                    circuit = health.circuit
+            self._health = EngineHealth(
+                healthy=error is None,
+                checked_at=time.time(),
+                circuit=circuit,
+                consecutive_failures=failures,
+                latency=latency,
+                error=error)
+        self._first_probe.set()
+
+    def _should_probe(self):
+        with self._lock:
+            health = self._health
+            if health.circuit != CircuitState.OPEN:
+                return True
+            if time.monotonic() - self._opened_at < RECOVERY_TIMEOUT:
+                return False
+            self._health = EngineHealth(
+                healthy=health.healthy,
+                checked_at=health.checked_at,
+                circuit=CircuitState.HALF_OPEN,
+                consecutive_failures=health.consecutive_failures,
+                latency=health.latency,
+                error=health.error)
+            return True
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"heartbeat-{self.host}",
+                    daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if time.monotonic() - self._last_read >= IDLE_TIMEOUT:
+                    self._thread = None
+                    return
+            if self._should_probe():
+                self.probe()
+            time.sleep(HEARTBEAT_INTERVAL)
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def get_monitor(host):
+    with _monitors_lock:
+        monitor = _monitors.get(host)
+        if monitor is None:
+            monitor = _monitors[host] = HeartbeatMonitor(host)
+        return monitor
+
+
+def _best(healths):
+    # The engine is up when any of its replicas is; report the fastest one.
+    return min(healths, key=lambda health: (
+        health.healthy is not True, health.latency is None, health.latency or 0))
+
+
+def get_engine_health(host, wait=0):
+    """Returns the cached health of `host`, waiting up to `wait` seconds for the
+    very first probe. For several replicas the healthiest one is returned."""
+    replicas = engine_router.parse_hosts(host)
+    if len(replicas) == 1:
+        return get_monitor(replicas[0]).status(wait=wait)
+    monitors = [get_monitor(replica) for replica in replicas]
+    deadline = time.monotonic() + wait
+    healths = [monitor.status() for monitor in monitors]
+    if wait:
+        healths = [monitor.status(wait=max(deadline - time.monotonic(), 0)) for monitor in monitors]  # noqa: E501
+    return _best(healths)
+
+
+def check_engine_health(host):
+    """Probes `host` right away, e.g. when the user explicitly asks to connect."""
+    replicas = engine_router.parse_hosts(host)
+    if len(replicas) == 1:
+        return get_monitor(replicas[0]).probe()
+    with ThreadPoolExecutor(max_workers=len(replicas), thread_name_prefix="heartbeat-check") as executor:  # noqa: E501
+        return _best(executor.map(lambda replica: get_monitor(replica).probe(), replicas))  # noqa: E501
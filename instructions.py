@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, List, Tuple
+
+import requests
+
+import disk_cache
+import engine_client
+import record_frames
+from golden_record_upload import RejectedLine
+from ttl_cache import TTLCache
+
+INSTRUCTIONS_CACHE_TTL = int(os.environ.get("INSTRUCTIONS_CACHE_TTL", 60))
+INSTRUCTIONS_PAGE_SIZE = int(os.environ.get("INSTRUCTIONS_PAGE_SIZE", 500))
+BULK_CONCURRENCY = int(os.environ.get("INSTRUCTIONS_BULK_CONCURRENCY", 8))
+
+_frames = TTLCache(INSTRUCTIONS_CACHE_TTL, 64)
+
+
+@dataclass
+class BulkResult:
+    succeeded: List[Any] = field(default_factory=list)
+    # (item, error) pairs in the order the items were given.
+    failed: List[Tuple[Any, str]] = field(default_factory=list)
+
+
+def _iter_instructions(host, db_connection_id):
+    page = 1
+    while True:
+        params = {
+            "db_connection_id": db_connection_id,
+            "page": page,
+            "limit": INSTRUCTIONS_PAGE_SIZE
+        }
+        received = 0
+        for instruction in record_frames.iter_records(host, "/api/v1/instructions", params):  # noqa: E501
+            received += 1
+            yield instruction
+        if received < INSTRUCTIONS_PAGE_SIZE:
+            return
+        page += 1
+
+
+def fetch_frame(host, db_connection_id):
+    """Returns all instructions of a connection as a frame, fetched a page at a
+    time and cached per connection until it expires or is invalidated."""
+    return _frames.get_or_load(
+        (host, db_connection_id),
+        lambda: record_frames.load_frame(
+            _iter_instructions(host, db_connection_id), record_frames.INSTRUCTION_COLUMNS))  # noqa: E501
+
+
+def _forget(host, db_connection_id=None):
+    _frames.invalidate(
+        lambda key: key[0] == host and db_connection_id in (None, key[1]))
+
+
+def invalidate(host, db_connection_id=None):
+    disk_cache.invalidate(host, "/api/v1/instructions")
+    _forget(host, db_connection_id)
+
+
+disk_cache.on_change(
+    "/api/v1/instructions",
+    lambda host, path, params: _forget(host, (params or {}).get("db_connection_id")))  # noqa: E501
+
+
+def parse_instructions(file, file_name):
+    """Reads instruction texts from a JSONL file with an "instruction" key per
+    line or from a CSV file with an "instruction" column.
+
+    Returns the texts and the lines that were skipped.
+    """
+    texts = []
+    rejected = []
+    lines = io.TextIOWrapper(file, encoding="utf-8", errors="replace", newline="")
+    if file_name.lower().endswith(".csv"):
+        reader = csv.DictReader(lines)
+        if "instruction" not in (reader.fieldnames or []):
+            return texts, [RejectedLine(1, "Missing an instruction column")]
+        # Line 1 holds the header.
+        rows = ((line_number, row.get("instruction")) for line_number, row in enumerate(reader, start=2))  # noqa: E501
+    else:
+        rows = _jsonl_rows(lines, rejected)
+    for line_number, text in rows:
+        if not isinstance(text, str) or not text.strip():
+            rejected.append(RejectedLine(line_number, "Missing instruction"))
+            continue
+        texts.append(text.strip())
+    lines.detach()
+    return texts, rejected
+
+
+def _jsonl_rows(lines, rejected):
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            line_data = json.loads(line)
+        except json.JSONDecodeError as e:
+            rejected.append(RejectedLine(line_number, f"Invalid JSON: {e}"))
+            continue
+        if not isinstance(line_data, dict):
+            rejected.append(RejectedLine(line_number, "Line is not a JSON object"))
+            continue
+        yield line_number, line_data.get("instruction")
+
+
+def _dispatch(send, items, concurrency):
+    """Calls `send(item)` for every item with at most `concurrency` requests in
+    flight. `send` returns an error message, or None on success."""
+    result = BulkResult()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="instructions") as executor:  # noqa: E501
+        for item, error in zip(items, executor.map(send, items)):
+            if error is None:
+                result.succeeded.append(item)
+            else:
+                result.failed.append((item, error))
+    return result
+
+
+def _error(response, expected_status):
+    if response.status_code == expected_status:
+        return None
+    return f"Status code {response.status_code}: {response.text}"
+
+
+def add_instructions(host, db_connection_id, texts, concurrency=BULK_CONCURRENCY):
+    def send(text):
+        request_body = {
+            "db_connection_id": db_connection_id,
+            "instruction": text
+        }
+        try:
+            return _error(engine_client.post(host, "/api/v1/instructions", json=request_body), 201)  # noqa: E501
+        except requests.exceptions.RequestException as e:
+            return str(e)
+
+    result = _dispatch(send, texts, concurrency)
+    if result.succeeded:
+        invalidate(host, db_connection_id)
+    return result
+
+
+def update_instructions(host, changes, concurrency=BULK_CONCURRENCY):
+    """Sends the new text of every instruction in `changes`, a dict of
+    instruction id to text."""
+    def send(instruction_id):
+        request_body = {
+            "instruction": changes[instruction_id]
+        }
+        try:
+            return _error(engine_client.put(host, f"/api/v1/instructions/{instruction_id}", json=request_body), 200)  # noqa: E501
+        except requests.exceptions.RequestException as e:
+            return str(e)
+
+    result = _dispatch(send, list(changes), concurrency)
+    if result.succeeded:
+        invalidate(host)
+    return result
+
+
+def delete_instructions(host, instruction_ids, concurrency=BULK_CONCURRENCY):
+    def send(instruction_id):
+        try:
+            return _error(engine_client.delete(host, f"/api/v1/instructions/{instruction_id}"), 200)  # noqa: E501
+        except requests.exceptions.RequestException as e:
+            return str(e)
+
+    result = _dispatch(send, instruction_ids, concurrency)
+    if result.succeeded:
+        invalidate(host)
+    return result
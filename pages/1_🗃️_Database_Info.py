@@ -1,108 +1,172 @@
+import time
+
 import streamlit as st
 import requests
-import pandas as pd
 
-def get_all_database_connections(api_url):
+import engine_client
+import engine_metrics
+import rerun_profiler
+import session_context
+import table_scanning
+import table_summaries
+
+def scan_tables(host, db_connection_id, table_names):
+    failed_batches = table_scanning.scan_tables(host, db_connection_id, table_names)
+    for batch, error in failed_batches:
+        st.warning(f"Could not scan {len(batch)} table(s) starting with {batch[0]}. {error}")  # noqa: E501
+    failed_tables = {table_name for batch, _ in failed_batches for table_name in batch}
+    scanned_tables = [name for name in table_names if name not in failed_tables]
+    if scanned_tables:
+        st.success(f"Table scanning started for {len(scanned_tables)} table(s).")
+    return scanned_tables
+
+def list_table_names(host, db_connection_id):
     try:
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            data = response.json()
-            return {entry["alias"]: entry["id"] for entry in data}
-        else:
-            st.warning("Could not get database connections.")
-            return {}
+        return context.resource(
+            db_connection_id, "table_names",
+            lambda: table_summaries.list_table_names(host, db_connection_id),
+            table_summaries.TABLE_SUMMARIES_CACHE_TTL)
+    except requests.exceptions.HTTPError:
+        st.warning("Could not get table descriptions.")
+        return []
     except requests.exceptions.RequestException:
         st.error("Connection failed.")
-        return {}
+        return []
+
+def show_scan_progress(poller):
+    """Shows the current scan status; returns whether it may still change."""
+    # pandas is imported where it is needed; the first render shows only forms.
+    import pandas as pd
+    st.subheader("Scan progress")
+    # Read before the snapshot, so the final statuses are always shown once.
+    running = poller.running
+    statuses = poller.snapshot()
+    finished = sum(status in table_scanning.TERMINAL_STATUSES for _, status in statuses)  # noqa: E501
+    st.progress(finished / len(statuses), text=f"{finished} of {len(statuses)} table(s) finished scanning.")  # noqa: E501
+    if poller.error:
+        st.warning(f"Could not refresh scan status. {poller.error}")
+    st.dataframe(
+        pd.DataFrame(statuses, columns=["Table name", "Status"]),
+        hide_index=True)
+    return running
 
-def scan_database(api_url, db_connection_id, table_name):
-    payload = {
-        "db_connection_id": db_connection_id,
-        "table_names": [table_name]
-    }
+def get_table_summaries(host, db_connection_id):
     try:
-        response = requests.post(api_url, json=payload)
-        if response.status_code == 201:
-            st.success("Table scanning started.")
-        else:
-            st.warning(f"Could not scan tables. {response.text}")
+        table_scanning.refresh_in_progress(host, db_connection_id)
+        return table_summaries.get_summaries(host, db_connection_id).sorted_rows()
+    except requests.exceptions.HTTPError:
+        st.warning("Could not get table descriptions.")
+        return None
     except requests.exceptions.RequestException:
         st.error("Connection failed.")
+        return None
 
-def list_table_descriptions(api_url, db_connection_id):
-    params = {
-        'db_connection_id': db_connection_id,
-    }
+def show_table_columns(host, table_description_id):
     try:
-        response = requests.get(api_url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.warning("Could not get table descriptions.")
-            return None
+        columns = table_summaries.get_columns(host, table_description_id)
     except requests.exceptions.RequestException:
-        st.error("Connection failed.")
-        return None
+        st.error("Could not get the columns of this table.")
+        return
+    if columns:
+        import pandas as pd
+        st.dataframe(pd.DataFrame(columns), hide_index=True)
+    else:
+        st.warning("This table has no scanned columns.")
 
 st.set_page_config(
     page_title="Dataherald",
     page_icon="./images/logo.png",
     layout="wide",
     initial_sidebar_state="collapsed")
+engine_metrics.start_rerun("Database Info")
 
-HOST = st.session_state.get("HOST", "")
+context = session_context.get_context()
+HOST = context.host
 
 st.title("🗃️ Database Information")
-api_url = f"{HOST}/api/v1"
 
-with st.form("database_connection"):
+with rerun_profiler.block("Form: database_connection"), st.form("database_connection"):  # noqa: E501
     st.subheader("Connect to an existing database:")
-    database_connections = get_all_database_connections(HOST + '/api/v1/database-connections')  # noqa: E501
-    database_connection = st.selectbox("Database", database_connections.keys())
+    database_connections = context.connections()
+    database_connection = st.selectbox("Database", database_connections.ids.keys())
     connect = st.form_submit_button("Connect to database")
     if connect:
-        st.session_state["database_connection_id"] = database_connections[database_connection]  # noqa: E501
+        engine_client.invalidate_database_connections()
+        context.invalidate()
+        context.database_connection_id = database_connections.id(database_connection)
         st.success(f"Connected to {database_connection}.")
 
-with st.form("Scan tables"):
-    st.header("Scan tables")
-    st.info("Here you can scan a table within a database to extract information from the given table.")  # noqa: E501
-    st.warning("Please note that only scanned tables are used by the agent")
-    database_connections = get_all_database_connections(f"{api_url}/database-connections")  # noqa: E501
-    database_connection = st.selectbox(
-        "Choose a database connection",
-        database_connections.keys())
-    table_name = st.text_input("Table name", value="")
-    if st.form_submit_button("Scan table"):
-        if table_name:
-            with st.spinner("Scanning table..."):
-                scan_database(f"{api_url}/table-descriptions/sync-schemas", database_connections[database_connection], table_name)  # noqa: E501
+st.header("Scan tables")
+st.info("Here you can scan tables within a database to extract information from the given tables.")  # noqa: E501
+st.warning("Please note that only scanned tables are used by the agent")
+database_connections = context.connections()
+scan_connection = st.selectbox(
+    "Choose a database connection",
+    database_connections.ids.keys())
+with rerun_profiler.block("Form: Scan tables"), st.form("Scan tables"):
+    scan_connection_id = database_connections.id(scan_connection)
+    table_names = st.multiselect(
+        "Tables",
+        list_table_names(HOST, scan_connection_id) if scan_connection_id else [])
+    scan_all = st.checkbox("Scan all tables")
+    if st.form_submit_button("Scan tables"):
+        if scan_all:
+            table_names = list_table_names(HOST, scan_connection_id)
+        if table_names:
+            with st.spinner("Scanning tables..."):
+                scanned_tables = scan_tables(HOST, scan_connection_id, table_names)
+            if scanned_tables:
+                previous_poller = st.session_state.get("scan_poller")
+                if previous_poller is not None:
+                    previous_poller.stop()
+                st.session_state["scan_poller"] = table_scanning.ScanPoller(
+                    HOST, scan_connection_id, scanned_tables).start()
         else:
-            st.warning("Please provide a table name.")
+            st.warning("Please select at least one table.")
+
+scan_running = False
+if st.session_state.get("scan_poller") is not None:
+    scan_running = show_scan_progress(st.session_state["scan_poller"])
 
-with st.form("View scanned tables"):
+with rerun_profiler.block("Form: View scanned tables"), st.form("View scanned tables"):  # noqa: E501
     st.header("View scanned tables")
     st.info("In this section you can view the tables that have been scanned.")
-    database_connections = get_all_database_connections(f"{api_url}/database-connections")  # noqa: E501
     database_connection = st.selectbox(
         "Available Database connections",
-        database_connections.keys())
+        database_connections.ids.keys())
     if st.form_submit_button("Show tables"):
-        with st.spinner("Finding table..."):
-            table_descriptions = list_table_descriptions(f"{api_url}/table-descriptions", database_connections[database_connection])  # noqa: E501
-        st.markdown("### List of Tables")
-        if table_descriptions:
-            table_info = []
-            for table_description in table_descriptions:
-                table_info.append([
-                    table_description['table_name'],
-                    table_description['description'],
-                    len(table_description['columns']),
-                    table_description['status']
-                    ])
-            df = pd.DataFrame(
-                table_info,
-                columns=['Table name', 'Description', 'Number of Columns', 'Status'])
-            st.table(df)
-        else:
-            st.warning("No table descriptions available.")
+        st.session_state["table_view_connection_id"] = database_connections.id(database_connection)  # noqa: E501
+
+if st.session_state.get("table_view_connection_id") is not None:
+    with st.spinner("Finding table..."):
+        table_rows = get_table_summaries(HOST, st.session_state["table_view_connection_id"])  # noqa: E501
+    st.markdown("### List of Tables")
+    if table_rows:
+        name_filter = st.text_input("Filter by table name", "")
+        if name_filter:
+            table_rows = [row for row in table_rows if name_filter.lower() in row["table_name"].lower()]  # noqa: E501
+        page_size = st.selectbox("Tables per page", (50, 100, 500), index=1)
+        page_count = max((len(table_rows) + page_size - 1) // page_size, 1)
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+        page_rows = table_rows[(page - 1) * page_size:page * page_size]
+        import pandas as pd
+        df = pd.DataFrame(
+            [(row["table_name"], row["description"], row["columns"], row["status"])
+             for row in page_rows],
+            columns=['Table name', 'Description', 'Number of Columns', 'Status'])
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        st.caption(f"Page {page} of {page_count}, {len(table_rows)} table(s).")
+        table_ids = {row["table_name"]: row["id"] for row in page_rows}
+        selected_table = st.selectbox("Show the columns of", [None, *table_ids])
+        if selected_table is not None:
+            show_table_columns(HOST, table_ids[selected_table])
+    else:
+        st.warning("No table descriptions available.")
+
+engine_metrics.finish_rerun()
+
+# The page shows one snapshot of the scan per run and reruns while the scan is
+# followed, so the other sections stay usable.
+if scan_running:
+    time.sleep(table_scanning.PROGRESS_REFRESH_INTERVAL)
+    st.rerun()
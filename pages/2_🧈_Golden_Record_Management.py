@@ -1,34 +1,25 @@
 import streamlit as st
-import pandas as pd
 import requests
-import json
-import sys
 
+import answer_cache
+import engine_client
+import engine_metrics
+import golden_record_index
+import golden_record_upload
+import golden_records as golden_record_store
+import record_frames
+import rerun_profiler
+import session_context
 
-def get_all_database_connections():
-    api_url = f'{HOST}/api/v1/database-connections'
-    try:
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            data = response.json()
-            aliases = {}
-            for entry in data:
-                aliases[entry["alias"]] = entry["id"]
-            return aliases
-        else:
-            st.warning("Could not get database connections. ")
-            return {}
-    except requests.exceptions.ConnectionError:
-        st.error("Connection failed.")
-        return {}
 
 def add_golden_records(data):
-    api_url = f'{HOST}/api/v1/golden-sqls'
-
     try:
-        response = requests.post(api_url, json=data)
+        response = engine_client.post(HOST, "/api/v1/golden-sqls", json=data)
         
         if response.status_code == 201:
+            golden_record_store.invalidate(HOST, context.database_connection_id)
+            golden_record_index.add_records(HOST, context.database_connection_id, response.json())  # noqa: E501
+            answer_cache.invalidate(HOST, context.database_connection_id)
             st.success("Golden record(s) added successfully.")
             return True
         else:
@@ -38,31 +29,126 @@ def add_golden_records(data):
         st.error("Connection failed.")
         return False
 
-def get_golden_records(db_connection_id, page=1, limit=sys.maxsize):
-    api_url = f'{HOST}/api/v1/golden-sqls'
-    params = {
-        'db_connection_id': db_connection_id,
-        'page': page,
-        'limit': limit
-    }
+def get_golden_records(db_connection_id, page=1, limit=10):
     try:
-        response = requests.get(api_url, params=params)
-        if response.status_code == 200:
-            golden_records = response.json()
-            return golden_records
+        golden_records = golden_record_store.fetch_frame(HOST, db_connection_id, page, limit)  # noqa: E501
+        golden_record_store.prefetch_frame(HOST, db_connection_id, page + 1, limit)
+        return golden_records
+    except requests.exceptions.HTTPError:
+        st.warning("Could not get golden records.")
+        return None
+    except requests.exceptions.RequestException as e:
+        st.error(f"Connection failed due to {e}.")
+        return None
+
+def search_golden_records(db_connection_id, search_query, page=1, limit=10):
+    index = golden_record_index.get_index(HOST, db_connection_id)
+    try:
+        if index.ready.is_set():
+            golden_records = index.search(search_query)[(page - 1) * limit:page * limit]  # noqa: E501
         else:
-            st.warning("Could not get golden records.")
-            return []
+            golden_records = golden_record_store.search(HOST, db_connection_id, search_query, page, limit)  # noqa: E501
+    except requests.exceptions.HTTPError:
+        st.warning("Could not get golden records.")
+        return None
     except requests.exceptions.RequestException as e:
         st.error(f"Connection failed due to {e}.")
-        return []
+        return None
+    return record_frames.load_frame(golden_records, record_frames.GOLDEN_RECORD_COLUMNS)  # noqa: E501
 
-def delete_golden_record(golden_record_id):
-    api_url = f'{HOST}/api/v1/golden-sqls/{golden_record_id}'
+def show_golden_record_count(db_connection_id):
+    # Counting takes a request per halving of the range, so it runs in the
+    # background and only once the records are viewed.
+    total_golden_records = golden_record_store.cached_count(HOST, db_connection_id)  # noqa: E501
+    if total_golden_records is None:
+        st.caption("Total golden records: counting…")
+    else:
+        st.write(f"Total golden records: {total_golden_records}")
 
+def get_fingerprints(db_connection_id):
     try:
-        response = requests.delete(api_url)
+        with st.spinner("Checking existing golden records..."):
+            return golden_record_store.fingerprints(HOST, db_connection_id)
+    except requests.exceptions.HTTPError:
+        st.warning("Could not get the existing golden records.")
+        return None
+    except requests.exceptions.RequestException as e:
+        st.error(f"Connection failed due to {e}.")
+        return None
+
+def show_diff(report):
+    statuses = report.statuses
+    st.write(
+        f"{statuses[golden_record_upload.DiffStatus.NEW]} new, "
+        f"{statuses[golden_record_upload.DiffStatus.CHANGED]} with changed SQL, "
+        f"{statuses[golden_record_upload.DiffStatus.DUPLICATE]} already existing, "
+        f"{statuses[golden_record_upload.DiffStatus.REPEATED]} repeated in the file.")  # noqa: E501
+    if report.diff:
+        import pandas as pd
+        st.dataframe(
+            pd.DataFrame(
+                [(line.line_number, line.status, line.prompt_text, line.existing_id)
+                 for line in report.diff],
+                columns=["Line", "Status", "Prompt text", "Existing golden record"]),  # noqa: E501
+            hide_index=True)
+
+def show_rejected(report):
+    if report.rejected:
+        import pandas as pd
+        st.warning(f"{len(report.rejected)} line(s) of the uploaded file were skipped.")  # noqa: E501
+        st.dataframe(
+            pd.DataFrame(
+                [(line.line_number, line.reason) for line in report.rejected],
+                columns=["Line", "Reason"]),
+            hide_index=True)
+
+def preview_golden_records(uploaded_file, skip_existing):
+    db_connection_id = context.database_connection_id
+    existing = get_fingerprints(db_connection_id) if skip_existing else None
+    if skip_existing and existing is None:
+        return
+    report = golden_record_upload.dry_run(db_connection_id, uploaded_file, existing)
+    st.info(f"Dry run: {report.statuses[golden_record_upload.DiffStatus.NEW] + report.statuses[golden_record_upload.DiffStatus.CHANGED]} golden record(s) would be uploaded.")  # noqa: E501
+    show_diff(report)
+    show_rejected(report)
+
+def upload_golden_records(uploaded_file, skip_existing):
+    db_connection_id = context.database_connection_id
+    existing = get_fingerprints(db_connection_id) if skip_existing else None
+    if skip_existing and existing is None:
+        return
+    progress_bar = st.progress(0.0, text="Uploading golden records...")
+
+    def on_progress(report):
+        progress_bar.progress(
+            min(report.bytes_read / max(uploaded_file.size, 1), 1.0),
+            text=f"Uploaded {report.uploaded} golden records ({report.records_per_second:.0f} records/s)")  # noqa: E501
+
+    def on_batch(created_records):
+        golden_record_index.add_records(HOST, db_connection_id, created_records)
+
+    report = golden_record_upload.upload(
+        HOST, db_connection_id, uploaded_file,
+        on_progress=on_progress, on_batch=on_batch, existing=existing)
+    golden_record_store.invalidate(HOST, db_connection_id)
+    answer_cache.invalidate(HOST, db_connection_id)
+    progress_bar.progress(1.0, text=f"Uploaded {report.uploaded} golden records in {report.elapsed:.1f}s.")  # noqa: E501
+    if report.uploaded:
+        st.success(f"{report.uploaded} golden record(s) added successfully.")
+    for failed_batch in report.failed_batches:
+        st.error(f"Could not upload lines {failed_batch.first_line}-{failed_batch.last_line} because {failed_batch.error}.")  # noqa: E501
+    if report.skipped:
+        st.info(f"{report.skipped} golden record(s) were not uploaded because they already exist.")  # noqa: E501
+    show_diff(report)
+    show_rejected(report)
+
+def delete_golden_record(golden_record_id):
+    try:
+        response = engine_client.delete(HOST, f"/api/v1/golden-sqls/{golden_record_id}")  # noqa: E501
         if response.status_code == 200:
+            golden_record_store.invalidate(HOST)
+            golden_record_index.remove_record(HOST, golden_record_id)
+            answer_cache.invalidate(HOST)
             st.success("Golden record deleted successfully.")
             return True
         else:
@@ -72,26 +158,27 @@ def delete_golden_record(golden_record_id):
         st.error(f"Connection failed due to {e}.")
         return False
 
-def find_key_by_value(dictionary, target_value):
-    for key, value in dictionary.items():
-        if value == target_value:
-            return key
-    return None
+def warn_near_duplicates(db_connection_id, question):
+    index = golden_record_index.get_index(HOST, db_connection_id)
+    if not index.ready.is_set():
+        return
+    for record, score in index.near_duplicates(question)[:5]:
+        st.warning(f"Similar golden record {record['id']} ({score:.0%}): {record['question']}")  # noqa: E501
 
 st.set_page_config(
     page_title="Dataherald",
     page_icon="./images/logo.png",
     layout="wide",
     initial_sidebar_state="collapsed")
+engine_metrics.start_rerun("Golden Record Management")
 
-HOST = st.session_state["HOST"]
+context = session_context.get_context()
+HOST = context.host
 
 st.title("🧈 Golden Record Management")
-database_connections = get_all_database_connections()
-db_name = find_key_by_value(database_connections, st.session_state["database_connection_id"])  # noqa: E501
-st.info(f"You are connected to {db_name}. Change the database connection from the Database Information page.")  # noqa: E501
+st.info(f"You are connected to {context.database_alias}. Change the database connection from the Database Information page.")  # noqa: E501
 
-with st.form("Golden records"):
+with rerun_profiler.block("Form: Golden records"), st.form("Golden records"):
     st.info("Here you can add or upload golden records. Golden records are used to improve the accuracy of the engine.")  # noqa: E501
     add_or_upload = st.radio(
         "Add or upload golden records",
@@ -104,83 +191,57 @@ with st.form("Golden records"):
     uploaded_file = upload_column.file_uploader(
         "Upload jsonl file (JSONL should contain prompt_text and sql keys))",
         type=["jsonl"])
+    skip_existing = upload_column.checkbox(
+        "Skip golden records that already exist", value=True,
+        help="Lines repeating an earlier line of the file are always skipped.")
+    dry_run = upload_column.checkbox(
+        "Dry run", help="Only report which golden records would be uploaded.")
     if st.form_submit_button("Upsert"):
         if add_or_upload == "Add":
-            with st.spinner("Adding golden record..."):
-                try:
+            if context.database_connection_id is None:
+                st.warning("Please select a database connection.")
+            else:
+                with st.spinner("Adding golden record..."):
                     data = {
-                        "db_connection_id": st.session_state["database_connection_id"],
+                        "db_connection_id": context.database_connection_id,
                         "prompt_text": prompt_text,
                         "sql": sql
                     }
-                except KeyError:
-                    st.warning("Please select a database connection.")
-                add_golden_records([data])
-        else:
-            with st.spinner("Uploading golden records..."):
-                if uploaded_file is not None:
-                    uploaded_data = []
-                    for line in uploaded_file:
-                        try:
-                            line_data = json.loads(line.decode("utf-8").strip())  
-                            if "prompt_text" in line_data and "sql" in line_data:
-                                uploaded_data.append({
-                                    "db_connection_id": st.session_state["database_connection_id"],  # noqa: E501
-                                    "prompt_text": line_data["prompt_text"],
-                                    "sql": line_data["sql"]
-                                })
-                            else:
-                                st.warning("Uploaded file contains incomplete data.")
-                        except KeyError:
-                            st.warning("Uploaded file contains incomplete data.")
-                        except json.JSONDecodeError as e:
-                            st.warning(
-                                f"Invalid JSON format in the uploaded file due to {e}."
-                                )
-                            
-                    add_golden_records(uploaded_data)
-
-with st.form("View golden records"):
+                    warn_near_duplicates(data["db_connection_id"], prompt_text)
+                    add_golden_records([data])
+        elif uploaded_file is not None:
+            if dry_run:
+                preview_golden_records(uploaded_file, skip_existing)
+            else:
+                upload_golden_records(uploaded_file, skip_existing)
+
+with rerun_profiler.block("Form: View golden records"), st.form("View golden records"):  # noqa: E501
     st.subheader("View golden records")
-    golden_records = get_golden_records(st.session_state["database_connection_id"])
-    st.write(f"Total golden records: {len(golden_records)}")
     search_query = st.text_input("Search by question or SQL query", "")
-    default_limit_value = min(10, len(golden_records))
     page = st.number_input("Page",
                             value=1,
                             min_value=1
                         )
     limit = st.number_input("Limit",
-                            min_value=0,
-                            max_value=len(golden_records),
-                            value=default_limit_value,
+                            min_value=1,
+                            max_value=golden_record_store.SEARCH_SCAN_LIMIT,
+                            value=10,
                         )
     if st.form_submit_button("View"):
+        show_golden_record_count(context.database_connection_id)
         with st.spinner("Loading golden records..."):
             if search_query:
-                golden_records = [
-                    record
-                    for record in golden_records
-                    if search_query.lower() in record["question"].lower()
-                    or search_query.lower() in record["sql_query"].lower()
-                ]
-            if len(golden_records) > 0:
-                df = pd.DataFrame(golden_records)
-                try:
-                    df = df[df['db_connection_id'] == st.session_state["database_connection_id"]]  # noqa: E501
-                except KeyError:
-                    st.warning("Please select a database connection.")
-                df = df.iloc[(page-1)*limit:page*limit]
-                df.drop(columns=["db_connection_id"], inplace=True)
-                df.reset_index(drop=True, inplace=True)
-                if golden_records:
-                    st.dataframe(df)
-                else:
-                    st.warning("No golden records found.")
+                golden_records = search_golden_records(
+                    context.database_connection_id, search_query, page, limit)  # noqa: E501
+            else:
+                golden_records = get_golden_records(
+                    context.database_connection_id, page, limit)
+            if golden_records is not None and len(golden_records) > 0:
+                st.dataframe(golden_records)
             else:
                 st.warning("No golden records found.")
 
-with st.form("Delete golden record"):
+with rerun_profiler.block("Form: Delete golden record"), st.form("Delete golden record"):  # noqa: E501
     st.subheader("Delete golden record")
     st.info("Here you can delete a golden record by providing the golden record ID.")  # noqa: E501
     golden_record_id = st.text_input("Golden record ID")
@@ -190,3 +251,5 @@ with st.form("Delete golden record"):
                 delete_golden_record(golden_record_id)
         else:
             st.warning("Please provide a golden record ID.")
+
+engine_metrics.finish_rerun()
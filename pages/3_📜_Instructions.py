@@ -1,35 +1,25 @@
 import streamlit as st
 import requests
-import sys
-import pandas as pd
 
+import answer_cache
+import engine_client
+import engine_metrics
+import instructions
+import rerun_profiler
+import session_context
 
-def get_all_database_connections():
-    api_url = f'{HOST}/api/v1/database-connections'
-    try:
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            data = response.json()
-            aliases = {}
-            for entry in data:
-                aliases[entry["alias"]] = entry["id"]
-            return aliases
-        else:
-            st.warning("Could not get database connections. ")
-            return {}
-    except requests.exceptions.ConnectionError:
-        st.error("Connection failed.")
-        return {}
-    
-def add_instruction(api_url, db_connection_id, instruction):
+
+def add_instruction(host, db_connection_id, instruction):
     request_body = {
         "db_connection_id": db_connection_id,
         "instruction": instruction
     }
     try:
-        response = requests.post(api_url, json=request_body)
+        response = engine_client.post(host, "/api/v1/instructions", json=request_body)
 
         if response.status_code == 201:
+            instructions.invalidate(host, db_connection_id)
+            refresh_instructions(host, db_connection_id)
             return response.json()
         else:
             st.error(f"Failed to add instruction. Status code: {response.status_code}")
@@ -38,117 +28,122 @@ def add_instruction(api_url, db_connection_id, instruction):
         st.error(f"Connection failed due to {e}.")
         return {}
     
-def get_instructions(api_url, db_connection_id, page=1, limit=sys.maxsize):
-    params = {
-        "db_connection_id": db_connection_id,
-        "page": page,
-        "limit": limit
-    }
+def get_instructions(host, db_connection_id):
     try:
-        response = requests.get(api_url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to retrieve instructions. Status code: {response.status_code}")  # noqa: E501
-            return []
+        return context.resource(
+            db_connection_id, "instructions",
+            lambda: instructions.fetch_frame(host, db_connection_id),
+            instructions.INSTRUCTIONS_CACHE_TTL)
+    except requests.exceptions.HTTPError as e:
+        st.error(f"Failed to retrieve instructions. Status code: {e.response.status_code}")  # noqa: E501
+        return None
     except requests.exceptions.RequestException as e:
         st.error(f"Connection failed due to {e}.")
-        return []
+        return None
     
-def delete_instruction(api_url, instruction_id):
-    endpoint = f"{api_url}/{instruction_id}"
-
-    try:
-        response = requests.delete(endpoint)
-
-        if response.status_code == 200:
-            return True
-        else:
-            st.error(f"Failed to delete instruction. Status code: {response.status_code}")
-            return False
-    except requests.exceptions.RequestException as e:
-        st.error(f"Connection failed due to {e}.")
-        return False
-    
-def update_instruction(api_url, instruction_id, new_instruction):
-    endpoint = f"{api_url}/{instruction_id}"
-
-    request_body = {
-        "instruction": new_instruction
-    }
-
-    headers = {"Content-Type": "application/json"}
+def refresh_instructions(host, db_connection_id=None):
+    context.invalidate("instructions", db_connection_id)
+    answer_cache.invalidate(host, db_connection_id)
+
+def show_failures(result, action):
+    for item, error in result.failed:
+        st.error(f"Failed to {action} {item}. {error}")
+
+def import_instructions(host, db_connection_id, uploaded_file):
+    texts, rejected = instructions.parse_instructions(uploaded_file, uploaded_file.name)
+    for line in rejected:
+        st.warning(f"Skipped line {line.line_number}: {line.reason}.")
+    if not texts:
+        st.warning("No instructions found in the file.")
+        return
+    result = instructions.add_instructions(host, db_connection_id, texts)
+    if result.succeeded:
+        refresh_instructions(host, db_connection_id)
+        st.success(f"{len(result.succeeded)} instruction(s) added successfully.")
+    show_failures(result, "add instruction")
+
+def save_instruction_changes(host, instruction_frame, edited_rows):
+    """Sends only the rows changed in the editor: new texts as updates and
+    ticked rows as deletes, then refreshes the list once."""
+    deleted_ids = [instruction_frame["id"].iloc[row] for row, edits in edited_rows.items()  # noqa: E501
+                   if edits.get("delete")]
+    changes = {instruction_frame["id"].iloc[row]: edits["instruction"]
+               for row, edits in edited_rows.items()
+               if "instruction" in edits and not edits.get("delete")
+               and edits["instruction"] != instruction_frame["instruction"].iloc[row]}  # noqa: E501
+    if not changes and not deleted_ids:
+        st.info("Nothing to save.")
+        return
+    updated = instructions.update_instructions(host, changes)
+    deleted = instructions.delete_instructions(host, deleted_ids)
+    refresh_instructions(host)
+    if updated.succeeded:
+        st.success(f"{len(updated.succeeded)} instruction(s) updated successfully.")
+    if deleted.succeeded:
+        st.success(f"{len(deleted.succeeded)} instruction(s) deleted successfully.")
+    show_failures(updated, "update instruction")
+    show_failures(deleted, "delete instruction")
+    # A fresh editor for the reloaded list.
+    st.session_state["instruction_editor_version"] = st.session_state.get("instruction_editor_version", 0) + 1  # noqa: E501
 
-    try:
-        response = requests.put(endpoint, json=request_body, headers=headers)
-
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to update instruction. Status code: {response.status_code}")
-            return {}
-    except requests.exceptions.RequestException as e:
-        st.error(f"Connection failed due to {e}.")
-        return {}
-
-
-def find_key_by_value(dictionary, target_value):
-    for key, value in dictionary.items():
-        if value == target_value:
-            return key
-    return None
 
 st.set_page_config(
     page_title="Dataherald",
     page_icon="./images/logo.png",
     layout="wide",
     initial_sidebar_state="collapsed")
+engine_metrics.start_rerun("Instructions")
 
-HOST = st.session_state["HOST"]
+context = session_context.get_context()
+HOST = context.host
 
 
 st.title("📜 Instructions")
-database_connections = get_all_database_connections()
-db_name = find_key_by_value(database_connections, st.session_state["database_connection_id"])  # noqa: E501
-st.info(f"You are connected to {db_name}. Change the database connection from the Database Information page.")  # noqa: E501
+st.info(f"You are connected to {context.database_alias}. Change the database connection from the Database Information page.")  # noqa: E501
 
-with st.form("add_instruction"):
+with rerun_profiler.block("Form: add_instruction"), st.form("add_instruction"):
     st.subheader("Add an instruction:")
     instruction = st.text_input("Instruction")
     if st.form_submit_button("Add"):
-        api_url = f'{HOST}/api/v1/instructions'
-        instruction = add_instruction(api_url, st.session_state["database_connection_id"], instruction)
+        instruction = add_instruction(HOST, context.database_connection_id, instruction)
         if instruction:
             st.success("Instruction added successfully.")
 
-with st.form("View all instructions"):
-    st.subheader("View all instructions:")
-    if st.form_submit_button("View"):
-        instructions = get_instructions(f'{HOST}/api/v1/instructions', st.session_state["database_connection_id"])
-        if instructions:
-            df = pd.DataFrame(instructions)
-            df = df.drop(columns=["metadata"])
-            st.dataframe(df)
+with rerun_profiler.block("Form: import_instructions"), st.form("import_instructions"):  # noqa: E501
+    st.subheader("Import instructions:")
+    uploaded_file = st.file_uploader(
+        "Upload a JSONL file with an instruction key per line or a CSV file with an instruction column",  # noqa: E501
+        type=["jsonl", "csv"])
+    if st.form_submit_button("Import"):
+        if uploaded_file is not None:
+            with st.spinner("Importing instructions..."):
+                import_instructions(HOST, context.database_connection_id, uploaded_file)  # noqa: E501
         else:
-            st.warning("No instructions found.")
-
-with st.form("Update instruction"):
-    st.subheader("Update an instruction:")
-    instruction_id = st.text_input("Instruction ID")
-    new_instruction = st.text_input("New instruction")
-    if st.form_submit_button("Update"):
-        instruction = update_instruction(f'{HOST}/api/v1/instructions', instruction_id, new_instruction)
-        if instruction:
-            st.success("Instruction updated successfully.")
-        else:
-            st.warning("Could not update instruction.")
-
-with st.form("Delete instruction"):
-    st.subheader("Delete an instruction:")
-    instruction_id = st.text_input("Instruction ID")
-    if st.form_submit_button("Delete"):
-        if delete_instruction(f'{HOST}/api/v1/instructions', instruction_id):
-            st.success("Instruction deleted successfully.")
-        else:
-            st.warning("Could not delete instruction.")
+            st.warning("Please upload a file.")
 
+with rerun_profiler.block("Form: View all instructions"), st.form("View all instructions"):  # noqa: E501
+    st.subheader("View all instructions:")
+    if st.form_submit_button("View"):
+        st.session_state["instructions_viewed"] = True
+
+if st.session_state.get("instructions_viewed"):
+    instruction_frame = get_instructions(HOST, context.database_connection_id)
+    if instruction_frame is not None and len(instruction_frame):
+        with rerun_profiler.block("Form: Edit instructions"), st.form("Edit instructions"):  # noqa: E501
+            st.caption("Edit instruction texts or tick rows to delete, then save. Only the changed rows are sent.")  # noqa: E501
+            editor_key = f"instruction_editor_{st.session_state.get('instruction_editor_version', 0)}"  # noqa: E501
+            st.data_editor(
+                instruction_frame.assign(delete=False),
+                column_config={"delete": st.column_config.CheckboxColumn("Delete")},
+                disabled=["id", "db_connection_id"],
+                hide_index=True,
+                use_container_width=True,
+                key=editor_key)
+            if st.form_submit_button("Save changes"):
+                with st.spinner("Saving instructions..."):
+                    save_instruction_changes(
+                        HOST, instruction_frame, st.session_state[editor_key]["edited_rows"])  # noqa: E501
+    else:
+        st.warning("No instructions found.")
+
+engine_metrics.finish_rerun()
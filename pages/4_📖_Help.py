@@ -1,5 +1,8 @@
 import streamlit as st
-import requests
+
+import engine_metrics
+import rerun_profiler
+import session_context
 
 
 DB_INFORMATION = {
@@ -13,29 +16,13 @@ SAMPLE_QUESTIONS = {
     ]
 }
 
-def get_all_database_connections():
-    api_url = f'{HOST}/api/v1/database-connections'
-    try:
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            data = response.json()
-            aliases = {}
-            for entry in data:
-                aliases[entry["alias"]] = entry["id"]
-            return aliases
-        else:
-            st.warning("Could not get database connections. ")
-            return {}
-    except requests.exceptions.ConnectionError:
-        st.error("Connection failed.")
-        return {}
-
 st.set_page_config(
     page_title="Dataherald",
     page_icon="./images/logo.png",
     layout="wide")
+engine_metrics.start_rerun("Help")
 
-HOST = st.session_state["HOST"]
+context = session_context.get_context()
 
 with st.container():
     st.title("Introduction")
@@ -51,10 +38,9 @@ with st.container():
     st.write("👨‍🏫 Allow for Active Learning, allowing you to improve the performance with usage")
     st.write("🏎️ Be fast")
 
-with st.form("Database information"):
+with rerun_profiler.block("Form: Database information"), st.form("Database information"):  # noqa: E501
     st.title("What are the databases used by this tool?")
-    database_connections = get_all_database_connections()
-    database_connection = st.selectbox("Database", database_connections.keys())
+    database_connection = st.selectbox("Database", context.connections().ids.keys())
     get_info = st.form_submit_button("get database information")
     if get_info:
         st.write(f"Database: {database_connection}")
@@ -86,3 +72,4 @@ with st.container():
     st.write("2. **Senate Stock Database:** We plan to add a Senate Stock Database, expanding the range of data sources available for analysis and insights.")
     st.write("3. **Additional Golden Records:** To further enhance the performance of our NL-to-SQL engine, we will continue to add golden records for various databases, ensuring improved accuracy and speed.")
 
+engine_metrics.finish_rerun()
@@ -0,0 +1,72 @@
+import io
+import time
+
+import streamlit as st
+
+import batch_runner
+import engine_metrics
+import rerun_profiler
+import session_context
+
+
+st.set_page_config(
+    page_title="Dataherald",
+    page_icon="./images/logo.png",
+    layout="wide",
+    initial_sidebar_state="collapsed")
+engine_metrics.start_rerun("Batch Evaluation")
+
+context = session_context.get_context()
+HOST = context.host
+
+st.title("🧪 Batch Evaluation")
+st.info(f"You are connected to {context.database_alias}. Change the database connection from the Database Information page.")  # noqa: E501
+
+with rerun_profiler.block("Form: Run questions"), st.form("Run questions"):
+    st.info("Here you can run a set of questions against the engine, e.g. to check accuracy and throughput after adding golden records or instructions.")  # noqa: E501
+    uploaded_file = st.file_uploader(
+        "Upload jsonl file (JSONL should contain prompt_text and optionally sql keys)",  # noqa: E501
+        type=["jsonl"])
+    concurrency = st.number_input(
+        "Questions answered in parallel",
+        min_value=1,
+        max_value=32,
+        value=batch_runner.BATCH_CONCURRENCY)
+    if st.form_submit_button("Run"):
+        if uploaded_file is None:
+            st.warning("Please upload a file with questions.")
+        else:
+            questions, rejected = batch_runner.load_questions(uploaded_file)
+            for line_number in rejected:
+                st.warning(f"Skipping line {line_number}: no question found.")
+            progress_bar = st.progress(0.0, text="Running questions...")
+
+            def on_result(result, completed):
+                progress_bar.progress(
+                    completed / len(questions),
+                    text=f"Answered {completed} of {len(questions)} questions.")
+
+            start = time.monotonic()
+            results = batch_runner.run_batch(
+                HOST, context.database_connection_id, questions,
+                concurrency, on_result)
+            st.session_state["batch_results"] = results
+            st.session_state["batch_summary"] = batch_runner.summarize(
+                results, time.monotonic() - start)
+
+if st.session_state.get("batch_results"):
+    import pandas as pd
+    summary = st.session_state["batch_summary"]
+    columns = st.columns(4)
+    columns[0].metric("Questions", summary["questions"])
+    columns[1].metric("Errors", summary["errors"])
+    columns[2].metric("Latency p50 / p95", f"{summary['latency_p50'] or 0:.1f}s / {summary['latency_p95'] or 0:.1f}s")  # noqa: E501
+    if summary["sql_match_rate"] is not None:
+        columns[3].metric("Matching SQL", f"{summary['sql_match_rate']:.0%}")
+    df = pd.DataFrame(st.session_state["batch_results"]).drop(columns=["answer"])
+    st.dataframe(df, hide_index=True)
+    csv_file = io.StringIO()
+    batch_runner.write_csv(st.session_state["batch_results"], csv_file)
+    st.download_button("Download results", csv_file.getvalue(), "results.csv", "text/csv")  # noqa: E501
+
+engine_metrics.finish_rerun()
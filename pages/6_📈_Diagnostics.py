@@ -0,0 +1,64 @@
+import json
+import time
+
+import streamlit as st
+
+import engine_metrics
+import engine_router
+import heartbeat
+import session_context
+
+st.set_page_config(
+    page_title="Dataherald",
+    page_icon="./images/logo.png",
+    layout="wide",
+    initial_sidebar_state="collapsed")
+
+metrics = engine_metrics.metrics
+
+st.title("📈 Diagnostics")
+st.info("Here you can see how long the engine takes to answer each kind of request and how long each page takes to run. The numbers cover every session of this app server.")  # noqa: E501
+st.caption(f"Collected over the last {(time.time() - metrics.started_at) / 60:.0f} minute(s).")  # noqa: E501
+
+st.subheader("Engine requests")
+endpoint_rows = metrics.endpoint_rows()
+if endpoint_rows:
+    # pandas is imported where it is needed, so the page starts without it
+    # until there is something to show.
+    import pandas as pd
+    st.dataframe(pd.DataFrame(endpoint_rows), hide_index=True, use_container_width=True)  # noqa: E501
+    st.caption("Percentiles are the upper bound of the histogram bucket they fall in.")  # noqa: E501
+else:
+    st.warning("No engine requests recorded yet.")
+
+replica_rows = engine_router.get_router(session_context.get_context().host).stats()
+if len(replica_rows) > 1:
+    st.subheader("Engine replicas")
+    for row in replica_rows:
+        row["healthy"] = heartbeat.get_engine_health(row["host"]).healthy
+    import pandas as pd
+    st.dataframe(pd.DataFrame(replica_rows), hide_index=True, use_container_width=True)  # noqa: E501
+    st.caption("Latency is a moving average of recent response times; requests go to the healthy replica with the lowest latency times requests in flight.")  # noqa: E501
+
+st.subheader("Page runs")
+rerun_rows = metrics.rerun_rows()
+if rerun_rows:
+    import pandas as pd
+    st.dataframe(pd.DataFrame(rerun_rows), hide_index=True, use_container_width=True)  # noqa: E501
+else:
+    st.warning("No page runs recorded yet.")
+
+export_column, json_column, reset_column = st.columns(3)
+export_column.download_button(
+    "Export Prometheus metrics",
+    metrics.to_prometheus(),
+    "metrics.prom",
+    "text/plain")
+json_column.download_button(
+    "Export JSON",
+    json.dumps(metrics.to_json(), indent=2),
+    "metrics.json",
+    "application/json")
+if reset_column.button("Reset metrics"):
+    metrics.reset()
+    st.rerun()
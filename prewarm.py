@@ -0,0 +1,62 @@
+"""Starts the slow parts of a cold start in the background, once per server
+process and engine host, so the first page render finds them ready.
+
+That is the engine health probe, the database connection list, which also
+opens keep-alive connections in the shared pool, and the heavy imports that
+frames and query results need later.
+"""
+import importlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import engine_client
+import heartbeat
+
+PREWARM_ENABLED = os.environ.get("ENGINE_PREWARM", "1") != "0"
+HEAVY_MODULES = ("pandas", "pyarrow")
+
+_IMPORTS = object()
+_started = set()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prewarm")
+
+
+def _import_heavy_modules():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def _fetch_connections(host):
+    try:
+        engine_client.fetch_database_connections(host)
+    except requests.exceptions.RequestException:
+        # The page asks again and reports the error itself.
+        pass
+
+
+def _prewarm(host, imports):
+    if host:
+        _fetch_connections(host)
+    if imports:
+        # Only after the requests, so the imports do not slow down the render
+        # that is waiting for them.
+        _import_heavy_modules()
+
+
+def start(host=None):
+    """Prewarms `host`, and the heavy imports on the first call; returns
+    immediately."""
+    if not PREWARM_ENABLED:
+        return
+    with _lock:
+        new = {key for key in (_IMPORTS, host) if key} - _started
+        _started.update(new)
+    if host in new:
+        # Starts the background monitor; its first probe runs alongside the
+        # connection list request.
+        heartbeat.get_engine_health(host)
+    if new:
+        _executor.submit(_prewarm, host if host in new else None, _IMPORTS in new)
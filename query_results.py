@@ -0,0 +1,233 @@
+"""Query results in streamed answers.
+
+Answers show the rows a generated SQL query returned as Markdown tables. Those
+tables are taken out of the answer text while it streams and kept as typed
+Arrow columns instead, so large results can be paged and exported without
+rendering or copying every row.
+"""
+import os
+import re
+import tempfile
+import weakref
+
+# Rows shown per page of a query result.
+QUERY_RESULTS_PAGE_SIZE = int(os.environ.get("QUERY_RESULTS_PAGE_SIZE", 100))
+# Rows buffered as Python strings before they are packed into an Arrow array.
+QUERY_RESULTS_CHUNK_ROWS = int(os.environ.get("QUERY_RESULTS_CHUNK_ROWS", 10000))
+QUERY_RESULTS_EXPORT_DIR = os.environ.get("QUERY_RESULTS_EXPORT_DIR", "") or tempfile.gettempdir()  # noqa: E501
+
+EXPORT_FORMATS = {"CSV": ".csv", "Parquet": ".parquet"}
+
+_CELL_SEPARATOR = re.compile(r"(?<!\\)\|")
+_ALIGNMENT_CELL = re.compile(r"^:?-{3,}:?$")
+_NULLS = {"", "null", "none", "nan"}
+# Numbers whose text a numeric column would not keep, e.g. ZIP codes and
+# zero-padded ids ("02130") or an explicit sign ("+1").
+_PADDED_NUMBER = r"^\s*(\+|-?0[0-9])"
+
+
+def _cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in _CELL_SEPARATOR.split(line)]  # noqa: E501
+
+
+def _is_alignment_row(line):
+    cells = _cells(line)
+    return bool(cells) and all(_ALIGNMENT_CELL.match(cell) for cell in cells)
+
+
+def _remove_exports(exports):
+    for path in exports.values():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    exports.clear()
+
+
+def _typed(column):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column  # noqa: E501
+    column_types = [pa.bool_(), pa.timestamp("s")]
+    if not pc.any(pc.match_substring_regex(column, _PADDED_NUMBER)).as_py():
+        column_types[:0] = [pa.int64(), pa.float64()]
+    # Types tried in order; the first that fits every value wins.
+    for column_type in column_types:
+        try:
+            return column.cast(column_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            continue
+    if len(column) and len(column.unique()) <= len(column) // 2:
+        return column.dictionary_encode()
+    return column
+
+
+class QueryResult:
+    """The rows of one result table, built up while the answer streams.
+
+    Cells are buffered as strings and packed into Arrow string arrays every
+    QUERY_RESULTS_CHUNK_ROWS rows. finish() then picks a type per column.
+    pyarrow is only imported once an answer actually contains a table.
+
+    The newest export per format is kept on disk until discard_exports() is
+    called or the result is garbage collected, e.g. with its session.
+    """
+
+    def __init__(self, columns):
+        self.columns = _unique_names(columns)
+        self.table = None
+        self._rows = []
+        self._chunks = []
+        self._exports = {}
+        weakref.finalize(self, _remove_exports, self._exports)
+
+    def __len__(self):
+        if self.table is not None:
+            return self.table.num_rows
+        return sum(len(chunk) for chunk in self._chunks) + len(self._rows)
+
+    @property
+    def nbytes(self):
+        if self.table is not None:
+            return self.table.nbytes
+        return sum(chunk.nbytes for chunk in self._chunks)
+
+    def add_row(self, cells):
+        cells = (cells + [""] * len(self.columns))[:len(self.columns)]
+        self._rows.append([None if cell.lower() in _NULLS else cell for cell in cells])  # noqa: E501
+        if len(self._rows) >= QUERY_RESULTS_CHUNK_ROWS:
+            self._pack()
+
+    def _pack(self):
+        import pyarrow as pa
+        if self._rows:
+            self._chunks.append(pa.table(
+                {name: pa.array(values, pa.string())
+                 for name, values in zip(self.columns, zip(*self._rows))}))
+            self._rows = []
+
+    def finish(self):
+        if self.table is not None:
+            return self
+        import pyarrow as pa
+        self._pack()
+        if self._chunks:
+            strings = pa.concat_tables(self._chunks)
+        else:
+            strings = pa.table({name: pa.array([], pa.string()) for name in self.columns})  # noqa: E501
+        self.table = pa.table({name: _typed(strings[name]) for name in self.columns})  # noqa: E501
+        self._chunks = []
+        return self
+
+    def page(self, page, limit=QUERY_RESULTS_PAGE_SIZE):
+        """Returns rows (page - 1) * limit up to page * limit as a frame."""
+        return self.finish().table.slice((page - 1) * limit, limit).to_pandas()
+
+    def export(self, format, directory=QUERY_RESULTS_EXPORT_DIR):
+        """Writes the result to a new CSV or Parquet file a batch at a time and
+        returns its path. The previous export in that format is deleted."""
+        import pyarrow.csv
+        import pyarrow.parquet
+        table = self.finish().table
+        file = tempfile.NamedTemporaryFile(
+            dir=directory, prefix="query_result_", suffix=EXPORT_FORMATS[format], delete=False)  # noqa: E501
+        file.close()
+        if format == "Parquet":
+            writer = pyarrow.parquet.ParquetWriter(file.name, table.schema)
+        else:
+            writer = pyarrow.csv.CSVWriter(file.name, table.schema)
+        with writer:
+            for batch in table.to_batches(max_chunksize=QUERY_RESULTS_CHUNK_ROWS):
+                writer.write_batch(batch)
+        previous = self._exports.get(format)
+        self._exports[format] = file.name
+        if previous is not None:
+            _remove_exports({format: previous})
+        return file.name
+
+    def discard_exports(self):
+        _remove_exports(self._exports)
+
+
+def _unique_names(columns):
+    names = []
+    for position, column in enumerate(columns, start=1):
+        name = column or f"column_{position}"
+        while name in names:
+            name = f"{name}_{position}"
+        names.append(name)
+    return names
+
+
+class ResultExtractor:
+    """Splits streamed answer text into the text to show and QueryResults.
+
+    Feed it the streamed chunks, which end at line boundaries, with feed() and
+    call close() at the end. Each table is replaced by a short reference to
+    where the result is shown.
+    """
+
+    def __init__(self):
+        self.results = []
+        self._in_code_block = False
+        self._header = None
+        self._result = None
+
+    def feed(self, text):
+        return "".join(self._line(line) for line in text.splitlines(keepends=True))  # noqa: E501
+
+    def close(self):
+        text = self._end_table()
+        if self._header is not None:
+            text += self._header
+            self._header = None
+        return text
+
+    def _end_table(self):
+        if self._result is not None:
+            self._result.finish()
+            self._result = None
+        return ""
+
+    def _line(self, line):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            self._in_code_block = not self._in_code_block
+        if self._in_code_block or stripped.startswith("```"):
+            return self.close() + line
+        if self._result is not None:
+            if stripped.startswith("|"):
+                self._result.add_row(_cells(stripped))
+                return ""
+            self._end_table()
+        if self._header is not None:
+            header, self._header = self._header, None
+            if _is_alignment_row(stripped):
+                self._result = QueryResult(_cells(header))
+                self.results.append(self._result)
+                return f"\n*Query result {len(self.results)} is shown below the answer.*\n"  # noqa: E501
+            return header + self._line(line)
+        if stripped.startswith("|"):
+            # Only a header once the alignment row follows.
+            self._header = line
+            return ""
+        return line
+
+
+def extract(texts, results):
+    """Yields `texts` with their result tables taken out and appended to
+    `results` as they start."""
+    extractor = ResultExtractor()
+    extractor.results = results
+    for text in texts:
+        text = extractor.feed(text)
+        if text:
+            yield text
+    text = extractor.close()
+    if text:
+        yield text
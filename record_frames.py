@@ -0,0 +1,132 @@
+import codecs
+import json
+import re
+import time
+
+import disk_cache
+import engine_client
+import engine_metrics
+
+FRAME_CHUNK_SIZE = 64 * 1024
+
+GOLDEN_RECORD_COLUMNS = ("id", "question", "sql_query", "created_at")
+INSTRUCTION_COLUMNS = ("id", "db_connection_id", "instruction")
+# Every row of a connection's view repeats the same few values.
+CATEGORICAL_COLUMNS = {"db_connection_id"}
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# What may still follow a number cut short at the end of a chunk, e.g. "1." or
+# "1e".
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]+")
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(chunks):
+    """Yields the items of a top-level JSON array as its bytes arrive, so the
+    whole response is never held as text or as a list at once.
+
+    An item is only yielded once the "," or "]" after it has arrived, so a
+    value cut short by the end of a chunk is decoded again with the rest.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    empty = True
+    final = False
+    chunks = iter(chunks)
+    while not final:
+        chunk = next(chunks, None)
+        final = chunk is None
+        buffer += text_decoder.decode(chunk or b"", final=final)
+        position = _WHITESPACE.match(buffer).end()
+        if not started:
+            if position == len(buffer):
+                continue
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array.")
+            started = True
+            position = _WHITESPACE.match(buffer, position + 1).end()
+        # `position` is at the start of an item, or of "]" in an empty array.
+        while position < len(buffer):
+            if buffer[position] == "]" and empty:
+                return
+            if buffer[position] in ",]":
+                raise ValueError(f"Expected a JSON value at {buffer[position:position + 20]!r}.")  # noqa: E501
+            try:
+                item, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            separator = _WHITESPACE.match(buffer, end).end()
+            if separator == len(buffer):
+                break
+            if buffer[separator] not in ",]":
+                if not final and _NUMBER_TAIL.fullmatch(buffer, end):
+                    break
+                raise ValueError(f"Expected ',' or ']' after a JSON value at {buffer[separator:separator + 20]!r}.")  # noqa: E501
+            yield item
+            if buffer[separator] == "]":
+                return
+            empty = False
+            position = _WHITESPACE.match(buffer, separator + 1).end()
+        buffer = buffer[position:]
+    if started:
+        raise ValueError("Unterminated JSON array.")
+
+
+def load_frame(records, columns):
+    """Builds a frame holding only `columns` from an iterable of records,
+    appending to one list per column instead of keeping the records."""
+    values = {column: [] for column in columns}
+    for record in records:
+        for column in columns:
+            values[column].append(record.get(column))
+    # Imported here so pages that never build a frame start without pandas.
+    import pandas as pd
+    return pd.DataFrame({
+        column: pd.Categorical(column_values) if column in CATEGORICAL_COLUMNS else column_values  # noqa: E501
+        for column, column_values in values.items()}, columns=list(columns))
+
+
+def iter_records(host, path, params):
+    """GETs a JSON array from the engine and yields its items as they arrive.
+
+    With the disk cache enabled the raw body is also kept until the end of the
+    response, to be stored.
+    """
+    cacheable = disk_cache.cacheable(path)
+    if cacheable:
+        body = disk_cache.lookup(host, path, params)
+        if body is not None:
+            yield from iter_json_array([body])
+            return
+    body_chunks = [] if cacheable else None
+    received = 0
+    first_chunk_at = None
+    start = time.monotonic()
+
+    def chunks(response):
+        nonlocal received, first_chunk_at
+        for chunk in response.iter_content(chunk_size=FRAME_CHUNK_SIZE):
+            if first_chunk_at is None:
+                first_chunk_at = time.monotonic()
+            received += len(chunk)
+            if body_chunks is not None:
+                body_chunks.append(chunk)
+            yield chunk
+
+    try:
+        with engine_client.get(host, path, params=params, stream=True) as response:
+            response.raise_for_status()
+            yield from iter_json_array(chunks(response))
+            if body_chunks is not None:
+                disk_cache.store(host, path, params, b"".join(body_chunks), response.headers.get("ETag"))  # noqa: E501
+    finally:
+        engine_metrics.metrics.record_stream(
+            "GET", path, first_chunk_at - start if first_chunk_at else None, received)  # noqa: E501
+
+
+def fetch_frame(host, path, params, columns):
+    """GETs a JSON array from the engine and decodes it straight into a frame."""
+    return load_frame(iter_records(host, path, params), columns)
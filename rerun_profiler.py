@@ -0,0 +1,182 @@
+"""Opt-in profiler for page script runs.
+
+Set RERUN_PROFILER to "sidebar", "file" or "sidebar,file". Every run of a page
+is then broken down into the calls of the app's own functions and the blocks
+marked with block(), e.g. forms, with their wall time and the engine requests
+made while they ran. The breakdown is shown in a sidebar panel or appended to
+a JSON lines file in RERUN_PROFILER_DIR.
+
+Requests are counted for the whole app server, including background threads,
+so profile with a single session for exact numbers.
+"""
+import contextlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import streamlit as st
+
+import engine_metrics
+
+RERUN_PROFILER = {output.strip() for output in os.environ.get("RERUN_PROFILER", "").split(",") if output.strip()}  # noqa: E501
+RERUN_PROFILER_DIR = os.environ.get("RERUN_PROFILER_DIR", "profiles")
+
+_ROOT = str(Path(__file__).resolve().parent)
+_SKIPPED_FILES = {__file__, str(Path(__file__).resolve())}
+# Generators and coroutines report a call for every resume, so their time is
+# left to their consumer.
+_GENERATOR_FLAGS = (inspect.CO_GENERATOR | inspect.CO_COROUTINE
+                    | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR)
+_local = threading.local()
+
+
+def enabled():
+    return bool(RERUN_PROFILER)
+
+
+class _Node:
+    __slots__ = ("name", "calls", "elapsed", "requests", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.elapsed = 0.0
+        self.requests = 0
+        self.children = {}
+
+    @property
+    def self_elapsed(self):
+        return max(self.elapsed - sum(child.elapsed for child in self.children.values()), 0.0)  # noqa: E501
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "elapsed": self.elapsed,
+            "requests": self.requests,
+            "children": [child.to_dict() for child in self.children.values()],
+        }
+
+
+class RerunProfile:
+    """Call tree of one page script run. Calls with the same name under the
+    same parent are merged."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started_at = time.time()
+        self.root = _Node(page)
+        self._stack = [(self.root, time.perf_counter(), engine_metrics.metrics.request_count, None)]  # noqa: E501
+
+    def enter(self, name, frame=None):
+        parent = self._stack[-1][0]
+        node = parent.children.get(name)
+        if node is None:
+            node = parent.children[name] = _Node(name)
+        self._stack.append((node, time.perf_counter(), engine_metrics.metrics.request_count, frame))  # noqa: E501
+
+    def exit(self):
+        node, started_at, requests_at, _ = self._stack.pop()
+        node.calls += 1
+        node.elapsed += time.perf_counter() - started_at
+        node.requests += engine_metrics.metrics.request_count - requests_at
+
+    def finish(self):
+        while len(self._stack) > 1:
+            self.exit()
+        self.exit()
+        return self
+
+    def _trace(self, frame, event, arg):
+        if event == "call":
+            code = frame.f_code
+            if (code.co_filename.startswith(_ROOT) and code.co_filename not in _SKIPPED_FILES  # noqa: E501
+                    and not code.co_flags & _GENERATOR_FLAGS):
+                # co_qualname is new in Python 3.11.
+                name = getattr(code, "co_qualname", code.co_name)
+                self.enter(f"{Path(code.co_filename).stem}.{name}", frame)
+        elif event == "return" and self._stack[-1][3] is frame:
+            self.exit()
+
+    def rows(self):
+        """Returns the call tree depth first, as rows for a flame-style table."""
+        rows = []
+
+        def visit(node, depth):
+            rows.append({
+                "block": "  " * depth + node.name,
+                "calls": node.calls,
+                "total_ms": node.elapsed * 1000,
+                "self_ms": node.self_elapsed * 1000,
+                "share": node.elapsed / self.root.elapsed if self.root.elapsed else 0.0,  # noqa: E501
+                "requests": node.requests,
+            })
+            for child in sorted(node.children.values(), key=lambda child: child.elapsed, reverse=True):  # noqa: E501
+                visit(child, depth + 1)
+
+        visit(self.root, 0)
+        return rows
+
+    def to_dict(self):
+        return {"page": self.page, "started_at": self.started_at, "tree": self.root.to_dict()}  # noqa: E501
+
+
+def start(page):
+    """Starts profiling the current script run when the profiler is enabled.
+    A run that ended early, e.g. with st.stop(), is dropped."""
+    if not enabled():
+        return
+    profile = _local.profile = RerunProfile(page)
+    sys.setprofile(profile._trace)
+
+
+def finish():
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        return
+    sys.setprofile(None)
+    _local.profile = None
+    profile.finish()
+    if "file" in RERUN_PROFILER:
+        _dump(profile)
+    if "sidebar" in RERUN_PROFILER:
+        _show(profile)
+
+
+@contextlib.contextmanager
+def block(name):
+    """Times a block of a page script, e.g. a form, as its own entry."""
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit()
+
+
+def _dump(profile):
+    os.makedirs(RERUN_PROFILER_DIR, exist_ok=True)
+    with open(os.path.join(RERUN_PROFILER_DIR, "rerun_profiles.jsonl"), "a", encoding="utf-8") as file:  # noqa: E501
+        file.write(json.dumps(profile.to_dict()) + "\n")
+
+
+def _show(profile):
+    with st.sidebar.expander(f"Rerun profile: {profile.root.elapsed * 1000:.0f} ms, {profile.root.requests} requests"):  # noqa: E501
+        st.dataframe(
+            profile.rows(),
+            hide_index=True,
+            column_config={
+                "block": st.column_config.TextColumn("Block"),
+                "calls": st.column_config.NumberColumn("Calls"),
+                "total_ms": st.column_config.NumberColumn("Total (ms)", format="%.1f"),  # noqa: E501
+                "self_ms": st.column_config.NumberColumn("Self (ms)", format="%.1f"),
+                "share": st.column_config.ProgressColumn("Share of run", min_value=0, max_value=1),  # noqa: E501
+                "requests": st.column_config.NumberColumn("Requests"),
+            })
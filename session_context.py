@@ -0,0 +1,103 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import streamlit as st
+
+import engine_client
+
+_MISSING = object()
+
+
+class ConnectionIndex:
+    """The database connections of an engine, looked up by alias or by id."""
+
+    def __init__(self, connections):
+        self.ids = dict(connections)
+        self.aliases = {id: alias for alias, id in self.ids.items()}
+        self.fetched_at = time.time()
+
+    def id(self, alias):
+        return self.ids.get(alias)
+
+    def alias(self, id):
+        return self.aliases.get(id)
+
+    def __bool__(self):
+        return bool(self.ids)
+
+
+@dataclass
+class Resource:
+    value: Any
+    fetched_at: float = field(default_factory=time.time)
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+@dataclass
+class SessionContext:
+    """What every page of a browser session needs to know: the engine host, the
+    selected database connection and whatever has been loaded for it.
+
+    Resources are loaded the first time a page asks for them and reused by every
+    page of the session while they are fresh.
+    """
+    host: str = ""
+    database_connection_id: Optional[str] = None
+    _connections: Optional[ConnectionIndex] = None
+    _resources: Dict[Tuple[str, str], Resource] = field(default_factory=dict)
+
+    def set_host(self, host):
+        if host != self.host:
+            self.host = host
+            self._connections = None
+            self._resources.clear()
+
+    def connections(self):
+        if (self._connections is None
+                or time.time() - self._connections.fetched_at > engine_client.CONNECTIONS_CACHE_TTL  # noqa: E501
+                or self._connections.fetched_at < engine_client.connections_changed_at(self.host)):  # noqa: E501
+            connections = ConnectionIndex(engine_client.get_all_database_connections(self.host))  # noqa: E501
+            # A failed fetch returns no connections; try again on the next rerun.
+            if not connections:
+                return connections
+            self._connections = connections
+        return self._connections
+
+    @property
+    def database_alias(self):
+        return self.connections().alias(self.database_connection_id)
+
+    def select_connection(self, alias):
+        self.database_connection_id = self.connections().id(alias)
+
+    def resource(self, db_connection_id, name, loader, max_age):
+        """Returns the `name` resource of a connection, calling `loader` when it
+        has not been loaded in this session or is older than `max_age` seconds.
+        Nothing is stored when the loader raises."""
+        resource = self._resources.get((db_connection_id, name), _MISSING)
+        if resource is _MISSING or resource.age > max_age:
+            resource = self._resources[(db_connection_id, name)] = Resource(loader())
+        return resource.value
+
+    def fetched_at(self, db_connection_id, name):
+        resource = self._resources.get((db_connection_id, name))
+        return resource.fetched_at if resource is not None else None
+
+    def invalidate(self, name=None, db_connection_id=None):
+        """Drops the loaded resources matching `name` and `db_connection_id`.
+        Without arguments everything is dropped, the connection list included."""
+        if name is None and db_connection_id is None:
+            self._connections = None
+        for key in list(self._resources):
+            if db_connection_id in (None, key[0]) and name in (None, key[1]):
+                del self._resources[key]
+
+
+def get_context():
+    if "context" not in st.session_state:
+        st.session_state["context"] = SessionContext()
+    return st.session_state["context"]
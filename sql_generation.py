@@ -0,0 +1,108 @@
+import codecs
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import engine_client
+import engine_metrics
+
+LLM_NAME = "gpt-4-turbo-preview"
+
+_SQL_BLOCK_PATTERN = re.compile(r"```sql\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+@dataclass
+class StreamStats:
+    started_at: Optional[float] = None
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Whitespace-separated words, a cheap stand-in for LLM tokens.
+    tokens: int = 0
+    bytes: int = 0
+    cached: bool = False
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_token_at
+        return self.tokens / elapsed if elapsed > 0 else None
+
+
+def _lines(chunks):
+    # The incremental decoder keeps multi-byte characters that straddle two
+    # chunks intact; complete lines are yielded as soon as they arrive.
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        end = buffer.rfind("\n") + 1
+        if end:
+            yield buffer[:end]
+            buffer = buffer[end:]
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+def stream_sql_generation(host, db_connection_id, question, stats=None, on_response=None):  # noqa: E501
+    """Yields the engine's /stream-sql-generation output as it arrives, one or
+    more complete lines at a time. Timing is recorded on `stats` if given.
+
+    `on_response` is called with the open response, e.g. so another thread can
+    close it to stop the generation.
+    """
+    stats = stats if stats is not None else StreamStats()
+    request_body = {
+        "llm_config": {
+            "llm_name": LLM_NAME
+        },
+        "prompt": {
+            "text": question,
+            "db_connection_id": db_connection_id,
+        }
+    }
+    stats.started_at = time.monotonic()
+    try:
+        with engine_client.post(host, "/api/v1/stream-sql-generation", json=request_body, stream=True) as response:  # noqa: E501
+            response.raise_for_status()
+            if on_response is not None:
+                on_response(response)
+            for text in _lines(response.iter_content(chunk_size=None)):
+                if stats.first_token_at is None:
+                    stats.first_token_at = time.monotonic()
+                stats.tokens += len(text.split())
+                stats.bytes += len(text.encode("utf-8"))
+                yield text
+    finally:
+        stats.finished_at = time.monotonic()
+        engine_metrics.metrics.record_stream(
+            "POST", "/api/v1/stream-sql-generation", stats.time_to_first_token, stats.bytes)  # noqa: E501
+
+
+def extract_sql(answer):
+    """Returns the last SQL code block of an answer, or None."""
+    blocks = _SQL_BLOCK_PATTERN.findall(answer)
+    return blocks[-1].strip() if blocks else None
+
+
+def as_markdown(texts):
+    """Turns streamed lines into separate Markdown paragraphs, leaving fenced
+    code blocks untouched."""
+    in_code_block = False
+    for text in texts:
+        parts = []
+        for line in text.splitlines(keepends=True):
+            if line.lstrip().startswith("```"):
+                in_code_block = not in_code_block
+            elif not in_code_block and line.endswith("\n"):
+                line += "\n"
+            parts.append(line)
+        yield "".join(parts)
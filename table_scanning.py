@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import engine_client
+import table_summaries
+
+SCAN_BATCH_SIZE = int(os.environ.get("TABLE_SCAN_BATCH_SIZE", 50))
+SCAN_CONCURRENCY = int(os.environ.get("TABLE_SCAN_CONCURRENCY", 4))
+POLL_INITIAL_DELAY = float(os.environ.get("TABLE_SCAN_POLL_INITIAL_DELAY", 1))
+POLL_MAX_DELAY = float(os.environ.get("TABLE_SCAN_POLL_MAX_DELAY", 15))
+POLL_BACKOFF = 1.5
+POLL_TIMEOUT = float(os.environ.get("TABLE_SCAN_POLL_TIMEOUT", 3600))
+# Seconds between refreshes of the scan progress on the page.
+PROGRESS_REFRESH_INTERVAL = float(os.environ.get("TABLE_SCAN_PROGRESS_REFRESH_INTERVAL", 1))  # noqa: E501
+
+TERMINAL_STATUSES = {"SCANNED", "FAILED", "DEPRECATED"}
+
+# Running pollers per (host, db_connection_id).
+_followed = Counter()
+# (host, db_connection_id) -> (time of the next refresh, delay before it).
+_refreshes = {}
+_lock = threading.Lock()
+
+
+def _scan_batch(host, db_connection_id, table_names):
+    payload = {
+        "db_connection_id": db_connection_id,
+        "table_names": table_names
+    }
+    try:
+        response = engine_client.post(host, "/api/v1/table-descriptions/sync-schemas", json=payload)  # noqa: E501
+        if response.status_code == 201:
+            return None
+        return response.text
+    except requests.exceptions.RequestException as e:
+        return str(e)
+
+
+def scan_tables(host, db_connection_id, table_names, batch_size=SCAN_BATCH_SIZE):
+    """Requests a scan of `table_names` in batches sent in parallel.
+
+    Returns (table_names, error) pairs for the batches the engine rejected.
+    """
+    batches = [table_names[i:i + batch_size]
+               for i in range(0, len(table_names), batch_size)]
+    with ThreadPoolExecutor(max_workers=SCAN_CONCURRENCY, thread_name_prefix="table-scan") as executor:  # noqa: E501
+        errors = executor.map(
+            lambda batch: _scan_batch(host, db_connection_id, batch), batches)
+        failed_batches = [(batch, error) for batch, error in zip(batches, errors) if error]  # noqa: E501
+    failed_tables = {table_name for batch, _ in failed_batches for table_name in batch}
+    table_summaries.mark_scanning(
+        host, db_connection_id,
+        {table_name for table_name in table_names if table_name not in failed_tables})  # noqa: E501
+    return failed_batches
+
+
+class ScanPoller:
+    """Follows the scan status of a set of tables in a background thread.
+
+    The delay between polls grows while nothing changes and drops back to the
+    initial delay as soon as a status moves.
+    """
+
+    def __init__(self, host, db_connection_id, table_names):
+        self.host = host
+        self.db_connection_id = db_connection_id
+        self.statuses = dict.fromkeys(table_names, "SYNCHRONIZING")
+        self.error = None
+        self.updated_at = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"scan-poller-{db_connection_id}", daemon=True)
+
+    def start(self):
+        with _lock:
+            _followed[self.host, self.db_connection_id] += 1
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def done(self):
+        return all(status in TERMINAL_STATUSES for status in self.statuses.values())
+
+    def snapshot(self):
+        return sorted(self.statuses.items())
+
+    def _poll(self):
+        changed = False
+        table_descriptions = table_summaries.fetch_table_descriptions(self.host, self.db_connection_id)  # noqa: E501
+        table_summaries.update_summaries(self.host, self.db_connection_id, table_descriptions)  # noqa: E501
+        for table_description in table_descriptions:
+            table_name = table_description["table_name"]
+            status = table_description["status"]
+            if table_name in self.statuses and self.statuses[table_name] != status:
+                self.statuses[table_name] = status
+                changed = True
+        self.updated_at = time.time()
+        return changed
+
+    def _run(self):
+        try:
+            self._follow()
+        finally:
+            key = (self.host, self.db_connection_id)
+            with _lock:
+                _followed[key] -= 1
+                if not _followed[key]:
+                    del _followed[key]
+
+    def _follow(self):
+        deadline = time.monotonic() + POLL_TIMEOUT
+        delay = POLL_INITIAL_DELAY
+        while not self.done and time.monotonic() < deadline:
+            if self._stop.wait(delay):
+                return
+            try:
+                changed = self._poll()
+                self.error = None
+            except requests.exceptions.RequestException as e:
+                changed = False
+                self.error = str(e)
+            delay = POLL_INITIAL_DELAY if changed else min(delay * POLL_BACKOFF, POLL_MAX_DELAY)  # noqa: E501
+
+
+def refresh_in_progress(host, db_connection_id):
+    """Refreshes the cached table list while tables are being scanned and
+    returns how many rows changed.
+
+    Nothing is fetched while a ScanPoller follows the connection, since it
+    updates the list itself. Otherwise the whole list is fetched once, at most
+    as often as a poller would, backing off while nothing changes.
+    """
+    key = (host, db_connection_id)
+    with _lock:
+        if _followed[key]:
+            return 0
+    if not table_summaries.in_progress(host, db_connection_id):
+        return 0
+    now = time.monotonic()
+    with _lock:
+        next_refresh_at, delay = _refreshes.get(key, (now, POLL_INITIAL_DELAY))
+        if now < next_refresh_at:
+            return 0
+        # Claimed before fetching, so concurrent reruns do not fetch as well.
+        _refreshes[key] = (now + delay, delay)
+    table_descriptions = table_summaries.fetch_table_descriptions(host, db_connection_id)  # noqa: E501
+    changed = table_summaries.update_summaries(host, db_connection_id, table_descriptions)  # noqa: E501
+    delay = POLL_INITIAL_DELAY if changed else min(delay * POLL_BACKOFF, POLL_MAX_DELAY)  # noqa: E501
+    with _lock:
+        _refreshes[key] = (time.monotonic() + delay, delay)
+    return changed
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+
+import async_engine_client
+import disk_cache
+from ttl_cache import TTLCache
+
+TABLE_SUMMARIES_CACHE_TTL = int(os.environ.get("TABLE_SUMMARIES_CACHE_TTL", 900))
+
+IN_PROGRESS_STATUSES = {"SYNCHRONIZING"}
+
+_summaries = TTLCache(TABLE_SUMMARIES_CACHE_TTL, 64)
+_columns = TTLCache(TABLE_SUMMARIES_CACHE_TTL, 1024)
+_lock = threading.Lock()
+
+
+def summarize(table_description):
+    # Only what the table list shows is kept; the column details are dropped
+    # right away and loaded again per table on drill-down.
+    return {
+        "id": table_description["id"],
+        "table_name": table_description["table_name"],
+        "description": table_description.get("description"),
+        "columns": len(table_description.get("columns") or []),
+        "status": table_description["status"],
+    }
+
+
+class TableSummaries:
+    def __init__(self, table_descriptions):
+        self.rows = {}
+        self.fetched_at = time.time()
+        self.update(table_descriptions)
+
+    def update(self, table_descriptions):
+        """Applies table descriptions; returns the ids of the rows that changed."""
+        changed = []
+        for table_description in table_descriptions:
+            summary = summarize(table_description)
+            if self.rows.get(summary["id"]) != summary:
+                self.rows[summary["id"]] = summary
+                changed.append(summary["id"])
+        return changed
+
+    def sorted_rows(self):
+        return sorted(self.rows.values(), key=lambda row: row["table_name"])
+
+
+def fetch_table_descriptions(host, db_connection_id):
+    params = {
+        "db_connection_id": db_connection_id,
+    }
+    response = async_engine_client.coalesced_get(host, "/api/v1/table-descriptions", params=params)  # noqa: E501
+    response.raise_for_status()
+    return response.json()
+
+
+def _fetch_one(host, table_description_id):
+    response = async_engine_client.coalesced_get(host, f"/api/v1/table-descriptions/{table_description_id}")  # noqa: E501
+    response.raise_for_status()
+    return response.json()
+
+
+def get_summaries(host, db_connection_id):
+    return _summaries.get_or_load(
+        (host, db_connection_id),
+        lambda: TableSummaries(fetch_table_descriptions(host, db_connection_id)))
+
+
+def update_summaries(host, db_connection_id, table_descriptions):
+    """Applies freshly fetched table descriptions, e.g. from a scan poll, and
+    returns how many rows changed."""
+    summaries = _summaries.get((host, db_connection_id))
+    if summaries is None:
+        return 0
+    with _lock:
+        changed = summaries.update(table_descriptions)
+    for table_description_id in changed:
+        _columns.invalidate(lambda key: key == (host, table_description_id))
+    return len(changed)
+
+
+def in_progress(host, db_connection_id):
+    """Whether a table of the cached list is still being scanned."""
+    summaries = get_summaries(host, db_connection_id)
+    with _lock:
+        return any(row["status"] in IN_PROGRESS_STATUSES for row in summaries.rows.values())  # noqa: E501
+
+
+def mark_scanning(host, db_connection_id, table_names):
+    disk_cache.invalidate(host, "/api/v1/table-descriptions")
+    summaries = _summaries.get((host, db_connection_id))
+    if summaries is None:
+        return
+    with _lock:
+        for row in summaries.rows.values():
+            if row["table_name"] in table_names:
+                row["status"] = "SYNCHRONIZING"
+
+
+def get_columns(host, table_description_id):
+    return _columns.get_or_load(
+        (host, table_description_id),
+        lambda: _fetch_one(host, table_description_id).get("columns") or [])
+
+
+def list_table_names(host, db_connection_id):
+    return [row["table_name"] for row in get_summaries(host, db_connection_id).sorted_rows()]  # noqa: E501
+
+
+def invalidate(host, db_connection_id=None):
+    disk_cache.invalidate(host, "/api/v1/table-descriptions")
+    _summaries.invalidate(
+        lambda key: key[0] == host and db_connection_id in (None, key[1]))
+
+
+def _forget(host, path, params):
+    table_description_id = path[len("/api/v1/table-descriptions/"):]
+    if table_description_id:
+        _columns.invalidate(lambda key: key == (host, table_description_id))
+    else:
+        _summaries.invalidate(
+            lambda key: key[0] == host and key[1] == (params or {}).get("db_connection_id"))  # noqa: E501
+
+
+disk_cache.on_change("/api/v1/table-descriptions", _forget)
@@ -1,67 +1,105 @@
-import requests
+import math
+import os
 import streamlit as st
 import webbrowser
-import time
 
 from pathlib import Path
 
+import answer_jobs
+import chat_history
+import engine_client
+import engine_metrics
+import heartbeat
+import prewarm
+import query_results
+import session_context
+import sql_generation
+
 LOGO_PATH = Path(__file__).parent / "images" / "logo.png"
 DEFAULT_DATABASE = "RealEstate"
+DEFAULT_ENGINE_URI = os.environ.get("ENGINE_URI", "https://streamlit.dataherald.ai")
+
+def get_answer_job():
+    # The job id is also kept in the URL, so reloading the page resumes the answer.
+    job_id = st.session_state.get("answer_job_id") or st.query_params.get("answer")
+    return answer_jobs.get(job_id) if job_id else None
+
+def ask_question(host, db_connection_id, question):
+    previous_job = get_answer_job()
+    if previous_job is not None:
+        if previous_job.running:
+            previous_job.cancel()
+            # Closing the engine connection ends the job almost at once; it is
+            # then kept in the history as a stopped answer.
+            previous_job.wait(answer_jobs.ANSWER_JOB_CANCEL_TIMEOUT)
+        chat_history.get_history().record(previous_job)
+    job = answer_jobs.start(host, db_connection_id, question)
+    st.session_state["answer_job_id"] = job.id
+    st.query_params["answer"] = job.id
+    return job
+
+def show_outcome(container, turn):
+    note = chat_history.outcome(turn)
+    if note is not None:
+        kind, text = note
+        getattr(container, kind)(text)
+
+def show_result(container, key, position, result):
+    # Only the requested page is converted for display; exports are written
+    # to disk in batches when asked for.
+    pages = max(math.ceil(len(result) / query_results.QUERY_RESULTS_PAGE_SIZE), 1)
+    with container.expander(f"Query result {position} ({len(result)} rows)", expanded=position == 1):  # noqa: E501
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{key}_page")  # noqa: E501
+        st.dataframe(result.page(page), hide_index=True, use_container_width=True)
+        for column, (format, suffix) in zip(st.columns(len(query_results.EXPORT_FORMATS)), query_results.EXPORT_FORMATS.items()):  # noqa: E501
+            export_key = f"{key}_{format}"
+            if column.button(f"Export {format}", key=f"{export_key}_export"):
+                st.session_state[export_key] = result.export(format)
+            if export_key in st.session_state:
+                with open(st.session_state[export_key], "rb") as file:
+                    column.download_button(
+                        f"Download {format}", file, file_name=f"query_result_{position}{suffix}",  # noqa: E501
+                        key=f"{export_key}_download")
+
+def show_turn(container, turn):
+    container.chat_message("user").write(turn.question)
+    answer_container = container.chat_message("assistant")
+    answer_container.markdown("".join(sql_generation.as_markdown([turn.answer])))
+    show_results(answer_container, turn)
+    show_outcome(answer_container, turn)
 
-def get_all_database_connections(api_url):
-    try:
-        response = requests.get(api_url)
-        response_data = response.json()
-        return {entry["alias"]: entry["id"] for entry in response_data} if response.status_code == 200 else {}  # noqa: E501
-    except requests.exceptions.RequestException:
-        return {}
-
-def add_database_connection(api_url, connection_data):
-    try:
-        response = requests.post(api_url, json=connection_data)
-        return response.json() if response.status_code == 200 else None
-    except requests.exceptions.RequestException:
-        return None
-
-def answer_question(api_url, db_connection_id, question):
-    request_body = {
-        "llm_config": {
-            "llm_name": "gpt-4-turbo-preview"
-        },
-        "prompt": {
-            "text": question,
-            "db_connection_id": db_connection_id,
-        }
-    }
-    try:
-        with requests.post(api_url, json=request_body, stream=True) as response:
-            response.raise_for_status()
-            for chunk in response.iter_content(chunk_size=2048):
-                if chunk:
-                    response = chunk.decode("utf-8")
-                    yield response + "\n"
-                    time.sleep(0.1)
-    except requests.exceptions.RequestException as e:
-        st.error(f"Connection failed due to {e}.")
-
-def test_connection(url):
-    try:
-        response = requests.get(url)
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
+def show_results(container, turn):
+    for position, result in enumerate(turn.results, start=1):
+        show_result(container, f"result_{turn.job_id}_{position}", position, result)
+
+def show_history(container, history):
+    window = st.session_state.get("chat_history_window", chat_history.CHAT_HISTORY_WINDOW)  # noqa: E501
+    turns = history.window(window)
+    hidden = len(history) - len(turns)
+    if hidden and container.button(f"Show {min(hidden, chat_history.CHAT_HISTORY_WINDOW)} earlier questions"):  # noqa: E501
+        st.session_state["chat_history_window"] = window + chat_history.CHAT_HISTORY_WINDOW  # noqa: E501
+        st.rerun()
+    if history.evicted and len(turns) == len(history):
+        container.caption(f"{history.evicted} earlier questions were dropped from the history.")  # noqa: E501
+    for turn in turns:
+        show_turn(container, turn)
+
+def show_answer(container, history, job):
+    container.chat_message("user").write(job.question)
+    answer_container = container.chat_message("assistant")
+    if job.running and answer_container.button("Stop generating", key=f"stop_{job.id}"):  # noqa: E501
+        job.cancel()
+    with st.spinner("Agent starts..."):
+        answer_container.write_stream(sql_generation.as_markdown(job.tail()))
+    turn = history.record(job)
+    show_results(answer_container, turn)
+    show_outcome(answer_container, turn)
 
 def create_button_link(text, url):
     button_clicked = st.sidebar.button(text)
     if button_clicked:
         webbrowser.open_new_tab(url)
 
-def find_key_by_value(dictionary, target_value):
-    for key, value in dictionary.items():
-        if value == target_value:
-            return key
-    return None
-
 
 WAITING_TIME_TEXTS = [
     ":wave: Hello. Please, give me a few moments and I'll be back with your answer.",  # noqa: E501
@@ -79,6 +117,8 @@ st.set_page_config(
     page_title="Dataherald",
     page_icon="./images/logo.png",
     layout="wide")
+engine_metrics.start_rerun("Home")
+context = session_context.get_context()
 
 # Setup environment settings
 st.sidebar.title("Dataherald")
@@ -86,34 +126,55 @@ st.sidebar.write("Query your structured database in natural language.")
 st.sidebar.write("Enable business users to get answers to ad hoc data questions in seconds.")  # noqa: E501
 st.sidebar.page_link("https://www.dataherald.com/", label="Visit our website", icon="🌐")
 st.sidebar.subheader("Connect to the engine")
-HOST = st.sidebar.text_input("Engine URI", value="https://streamlit.dataherald.ai")
-st.session_state["HOST"] = HOST
+HOST = st.sidebar.text_input(
+    "Engine URI",
+    value=DEFAULT_ENGINE_URI,
+    help="Separate the URIs of several replicas of the engine with commas.")
+context.set_host(HOST)
+# The health probe and the connection list are requested in parallel, in the
+# background, while the rest of the page renders.
+prewarm.start(HOST)
 if st.sidebar.button("Connect"):
-    url = HOST + '/api/v1/heartbeat'
-    if test_connection(url):
+    engine_client.invalidate_database_connections()
+    context.invalidate()
+    if heartbeat.check_engine_health(HOST).healthy:
         st.sidebar.success("Connected to engine.")
     else:
         st.sidebar.error("Connection failed.")
 
 # Setup main page
 st.image("images/dataherald.png", width=500)
-if not test_connection(HOST + '/api/v1/heartbeat'):
+# Reads the health cached by the background monitor; only the very first render
+# for a host waits for a probe.
+if not heartbeat.get_engine_health(HOST, wait=heartbeat.HEARTBEAT_TIMEOUT).healthy:
     st.error("Could not connect to engine. Please connect to the engine on the left sidebar.")  # noqa: E501
     st.stop()
 else:
-    database_connections = get_all_database_connections(HOST + '/api/v1/database-connections')  # noqa: E501
-    if st.session_state.get("database_connection_id", None) is None:
-        st.session_state["database_connection_id"] = database_connections[DEFAULT_DATABASE]  # noqa: E501
-    db_name = find_key_by_value(database_connections, st.session_state["database_connection_id"])  # noqa: E501
-    st.warning(f"Connected to {db_name} database.")
+    if context.database_connection_id is None:
+        context.select_connection(DEFAULT_DATABASE)
+    st.warning(f"Connected to {context.database_alias} database.")
     st.info(INTRODUCTION_TEXT)  # noqa: E501
     st.info(INTRO_EXAMPLE)
 
 output_container = st.empty()
 user_input = st.chat_input("Ask your question")
 output_container = output_container.container()
-if user_input:
-    output_container.chat_message("user").write(user_input)
-    answer_container = output_container.chat_message("assistant")
-    with st.spinner("Agent starts..."):
-        st.write_stream(answer_question(HOST + '/api/v1/stream-sql-generation', st.session_state["database_connection_id"], user_input))
\ No newline at end of file
+# Answers are generated in the background: a rerun, e.g. for a new question,
+# does not lose the answer in progress and a new question stops the old one.
+answer_job = ask_question(HOST, context.database_connection_id, user_input) if user_input else get_answer_job()  # noqa: E501
+# Finished answers are shown from the history; only the newest turns are
+# rendered, so long sessions do not slow down every rerun.
+history = chat_history.get_history()
+if len(history) and st.sidebar.button("Clear chat history"):
+    history.clear()
+    st.session_state.pop("chat_history_window", None)
+    st.session_state["answer_job_id"] = None
+    st.query_params.pop("answer", None)
+    answer_job = None
+if answer_job is not None:
+    history.record(answer_job)
+show_history(output_container, history)
+if answer_job is not None and answer_job.id not in history:
+    show_answer(output_container, history, answer_job)
+
+engine_metrics.finish_rerun()